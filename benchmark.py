@@ -0,0 +1,264 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from database3_4 import MySql, QueryCache
+
+"""
+database3_4とpassword_windowのよく使われる処理の速度を計測するスクリプト
+
+python3 benchmark.py [--section セクション名] [--output 結果のファイル] [--rows 大きいテーブルの行数]
+セクションを省略すると一時ディレクトリに作ったSQLiteのファイルを使うため、ネットワークもMySQLサーバーも必要ありません
+結果はJSONで出力されるため、実行ごとの結果を比較できます
+計測用のテーブルは計測後に削除します
+"""
+
+BENCH_TABLE = 'benchmark_table'
+COLUMNS = ('name', 'password', 'memo', 'created')
+INSERT_ROWS = 2000  # insertとinsertManyの比較で追加する行数
+QUERY_ROWS = 1000  # ResultTupleの計測に使う問い合わせの行数
+LARGE_ROWS = 100000  # allValuesの計測に使う大きいテーブルの行数
+CONCURRENT_LOOKUPS = 100  # AsyncMySqlの計測で同時に行う問い合わせの数
+REPEAT = 5  # 各計測を繰り返す回数
+
+
+def _rows(count, prefix):
+    now = datetime.datetime.today().replace(microsecond=0)
+    return [('{}{}'.format(prefix, i), 'password{}'.format(i), 'memo of entry {}'.format(i), now)
+            for i in range(count)]
+
+
+def _measure(func, repeat=REPEAT, setup=None):
+    """
+    funcをrepeat回実行し、1回あたりの秒数の中央値と最小値を返します
+    setupは各実行の前に呼ばれ、時間に含めません
+    """
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {'median': statistics.median(times), 'min': min(times), 'repeat': repeat}
+
+
+class Bench(object):
+    """
+    計測用のテーブルを用意して各処理を計測するクラス
+    """
+
+    def __init__(self, dbArgs, largeRows=LARGE_ROWS):
+        self.dbArgs = dbArgs
+        self.largeRows = largeRows
+        self.results = {}
+
+    def db(self):
+        return MySql(**self.dbArgs)
+
+    def run(self):
+        try:
+            self.benchInsert()
+            self.benchResultTuple()
+            self.benchAsync()
+            self.benchAllValues()
+        finally:
+            with self.db() as mysql:
+                if mysql.hasTable(BENCH_TABLE):
+                    mysql.deleteTable(BENCH_TABLE)
+        self.benchFormat()
+        self.benchSearchable()
+        return self.results
+
+    def _resetTable(self, rows=0):
+        with self.db() as mysql:
+            if mysql.hasTable(BENCH_TABLE):
+                mysql.deleteTable(BENCH_TABLE)
+            mysql.createTable(
+                BENCH_TABLE,
+                ('id', 'int', 'auto_increment', 'not null', 'primary key'),
+                ('name', 'varchar(255)', 'unique', 'not null'),
+                ('password', 'varchar(64)'),
+                ('memo', 'text'),
+                ('created', 'datetime')
+            )
+            if rows:
+                mysql.insertMany(BENCH_TABLE, COLUMNS, _rows(rows, 'row'))
+
+    def benchInsert(self):
+        rows = _rows(INSERT_ROWS, 'entry')
+
+        def single():
+            with self.db() as mysql:
+                for row in rows:
+                    mysql.insert(BENCH_TABLE, COLUMNS, row)
+
+        def bulk():
+            with self.db() as mysql:
+                mysql.insertMany(BENCH_TABLE, COLUMNS, rows)
+
+        self.results['insert'] = _measure(single, setup=self._resetTable)
+        self.results['insertMany'] = _measure(bulk, setup=self._resetTable)
+        for name in ('insert', 'insertMany'):
+            self.results[name]['rows'] = INSERT_ROWS
+            self.results[name]['rowsPerSec'] = INSERT_ROWS / self.results[name]['median']
+
+    def benchResultTuple(self):
+        self._resetTable(QUERY_ROWS)
+        with self.db() as mysql:
+            sql = 'select * from ' + BENCH_TABLE
+            self.results['query'] = _measure(lambda: mysql.query(sql))
+            result = mysql.query(sql)
+
+            def nextGet():
+                result.reset()
+                while result.next():
+                    result.get('name')
+                    result.get('memo')
+
+            def iterate():
+                for row in result:
+                    row['name']
+
+            self.results['ResultTuple.next+get'] = _measure(nextGet)
+            self.results['ResultTuple.__iter__'] = _measure(iterate)
+            # values()は列の値を保存するため、毎回新しいResultTupleで計測する
+            clones = []
+            self.results['ResultTuple.values'] = _measure(
+                lambda: clones[-1].values('name'), setup=lambda: clones.append(result.clone()))
+            self.results['query.lookup'] = _measure(
+                lambda: mysql.query('select * from {} where name=%s'.format(BENCH_TABLE), ('row500', )))
+        with MySql(result_cache=QueryCache(), **self.dbArgs) as mysql:
+            self.results['query.lookup.cached'] = _measure(
+                lambda: mysql.query('select * from {} where name=%s'.format(BENCH_TABLE), ('row500', )))
+        for name in ('query', 'ResultTuple.next+get', 'ResultTuple.__iter__', 'ResultTuple.values'):
+            self.results[name]['rows'] = QUERY_ROWS
+
+    def benchAsync(self):
+        """
+        CONCURRENT_LOOKUPS件の問い合わせを、ひとつの接続で順番に行う場合とAsyncMySqlで同時に行う場合を比べます
+        benchResultTuple()で作ったテーブルを使います
+        AsyncMySqlはPython 3.7以降が必要なため、それより古ければ計測せずに理由を記録します
+        """
+        if sys.version_info < (3, 7):
+            self.results['query.lookup.async'] = {'skipped': 'AsyncMySql requires Python 3.7'}
+            return
+        from db_async import AsyncMySql
+        sql = 'select * from {} where name=%s'.format(BENCH_TABLE)
+        names = ['row{}'.format(i) for i in range(CONCURRENT_LOOKUPS)]
+        with self.db() as mysql:
+            self.results['query.lookup.sequential'] = _measure(
+                lambda: [mysql.query(sql, (name, )) for name in names])
+
+        async def lookups(db):
+            await asyncio.gather(*[db.query(sql, (name, )) for name in names])
+
+        loop = asyncio.new_event_loop()
+        try:
+            db = AsyncMySql(**self.dbArgs).open()
+            self.results['query.lookup.async'] = _measure(lambda: loop.run_until_complete(lookups(db)))
+            loop.run_until_complete(db.close())
+        finally:
+            loop.close()
+        for name in ('query.lookup.sequential', 'query.lookup.async'):
+            self.results[name]['lookups'] = CONCURRENT_LOOKUPS
+
+    def benchAllValues(self):
+        for rows in (1000, self.largeRows):
+            self._resetTable(rows)
+            with self.db() as mysql:
+                result = _measure(lambda: mysql.allValues(BENCH_TABLE, 'name'))
+            result['rows'] = rows
+            self.results['allValues.{}'.format(rows)] = result
+
+    def benchFormat(self):
+        mysql = MySql()
+        values = ['name', 'password', datetime.datetime.today(), 25, None] * 2000
+
+        def formatAll():
+            for value in values:
+                mysql._format(value)
+
+        self.results['_format'] = _measure(formatAll)
+        self.results['_format']['values'] = len(values)
+
+    def benchSearchable(self):
+        """
+        オフスクリーンのQtで実際のPasswordUIWindowを作り、要素の検索を計測します
+        PyQt5がなければ計測せずに理由を記録します
+        """
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        try:
+            from PyQt5.QtWidgets import QApplication
+            import password_window
+        except ImportError as e:
+            self.results['Searchable'] = {'skipped': str(e)}
+            return
+        app = QApplication.instance() or QApplication(sys.argv)
+        workDir = tempfile.mkdtemp()
+        try:
+            initFile = os.path.join(workDir, 'config.ini')
+            with open(initFile, 'w') as f:
+                f.write('[{}]\nbackend = sqlite\npath = {}\n'.format(
+                    password_window.INIT_SECTION, os.path.join(workDir, 'password.sqlite3')))
+            password_window.INIT_FILE = initFile
+            window = password_window.PasswordUIWindow()
+            memoInput = password_window.MemoInput
+            selector = lambda e: isinstance(e, memoInput)
+            self.results['Searchable.findElem'] = _measure(
+                lambda: [window.findElem(selector) for _ in range(1000)])
+            self.results['Searchable.findByType'] = _measure(
+                lambda: [window.findByType(memoInput) for _ in range(1000)])
+            self.results['Searchable.findElem']['calls'] = 1000
+            self.results['Searchable.findByType']['calls'] = 1000
+            window.close()
+            app.processEvents()
+        finally:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='database3_4とpassword_windowの計測')
+    parser.add_argument('--section', help='計測に使う設定ファイルのセクション。省略すれば一時的なSQLiteのファイル')
+    parser.add_argument('--output', help='結果のJSONを書き込むファイル。省略すれば標準出力')
+    parser.add_argument('--rows', type=int, default=LARGE_ROWS, help='allValuesの計測に使う大きいテーブルの行数')
+    args = parser.parse_args(argv)
+
+    workDir = None
+    if args.section:
+        dbArgs = {'init_section': args.section}
+    else:
+        workDir = tempfile.mkdtemp()
+        dbArgs = {'backend': 'sqlite', 'path': os.path.join(workDir, 'benchmark.sqlite3')}
+    try:
+        results = Bench(dbArgs, args.rows).run()
+    finally:
+        if workDir is not None:
+            shutil.rmtree(workDir, ignore_errors=True)
+
+    report = {
+        'time': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'database': args.section or 'sqlite',
+        'results': results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,15 +1,445 @@
 #! /usr/bin/python3.4
 # -*- coding: utf-8 -*-
-import MySQLdb.cursors
+import os
+import re
+import sys
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from contextlib import contextmanager
+import time
 from configparser import ConfigParser
+from db_backend import getBackend
 
 """
 データベースに問い合わせるためのクラス
 
+MySQLサーバーのほか、設定ファイルでbackend = sqliteを指定すればSQLiteのファイルも同じように扱えます(db_backend.pyを参照)
 使い方はファイル下部にあるif __name__ == '__main__'句を参照してください
 """
 
 INIT_FILE_PATH = './config.ini'
+POOL_SIZE = 5  # 接続先ごとにプールが保持する接続数の上限
+POOL_IDLE_TIMEOUT = 300  # この秒数より長く使われていない接続は閉じる
+POOL_WAIT_TIMEOUT = 30  # 接続が空くのを待つ最大秒数
+STREAM_FETCH_SIZE = 500  # ストリーミング時に一度にサーバーから受け取る行数
+VALUES_CHUNK_SIZE = 1000  # chunkedValues()が一度に返す行数
+INSERT_BATCH_SIZE = 500  # insertMany()が一つのinsert文にまとめる行数
+STATEMENT_CACHE_SIZE = 256  # insert()などが生成したSQLを保存しておく数
+CONFIG_CHECK_INTERVAL = 2  # 設定ファイルの更新日時を確認し直すまでの秒数
+SEARCH_LIMIT = 50  # search()が返す行数の上限
+SCHEMA_CACHE_TTL = 60  # tables()やcolumns()の結果を問い合わせ直さずに使う秒数
+RESULT_CACHE_ENTRIES = 1000  # QueryCacheが保持する結果の数の上限
+RESULT_CACHE_BYTES = 16 * 1024 * 1024  # QueryCacheが保持する結果の大きさの合計の上限(おおよそのバイト数)
+
+
+class ConnectionPool(object):
+    """
+    同じ接続先(MySQLならホスト、データベース、ユーザー)へのデータベース接続を使い回すためのクラスです
+    MySqlオブジェクトはwith文に入るたびに接続を借り、抜けるときに返却します
+    スレッドセーフです
+    """
+
+    _pools = {}
+    _poolsLock = threading.Lock()
+
+    def __init__(self, backend, params, size=POOL_SIZE, idleTimeout=POOL_IDLE_TIMEOUT):
+        """
+        @param backend 接続に使うバックエンド
+        @param params バックエンドに渡す接続先の設定
+        @param size 同時に存在できる接続数の上限
+        @param idleTimeout 返却後この秒数を超えて使われなかった接続は閉じる
+        """
+        self.backend = backend
+        self.params = params
+        self.size = size
+        self.idleTimeout = idleTimeout
+        self._idle = []  # (接続, 返却時刻)のリスト。末尾ほど最近返却されたもの
+        self._opened = 0  # 貸出中と待機中を合わせた接続数
+        self._cond = threading.Condition()
+
+    @classmethod
+    def get(cls, backend, params, size=POOL_SIZE):
+        """
+        接続先に対応するプロセス全体で共有のプールを返します
+        まだ存在しなければ作成します
+        """
+        key = backend.poolKey(params)
+        with cls._poolsLock:
+            pool = cls._pools.get(key)
+            if pool is None:
+                pool = cls(backend, params, size)
+                cls._pools[key] = pool
+            return pool
+
+    @classmethod
+    def closeAll(cls):
+        """
+        すべてのプールの待機中の接続を閉じ、プールを破棄します
+        """
+        with cls._poolsLock:
+            pools = list(cls._pools.values())
+            cls._pools.clear()
+        for pool in pools:
+            pool.close()
+
+    def acquire(self, timeout=POOL_WAIT_TIMEOUT):
+        """
+        接続を借ります
+        待機中の接続はpingで生存を確認してから渡し、なければ新しく接続します
+        上限に達している場合はいずれかの接続が返却されるまで待ちます
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                self._evictIdle()
+                while self._idle:
+                    connector, _ = self._idle.pop()
+                    if self.backend.ping(connector):
+                        return connector
+                    self._discard(connector)
+                if self._opened < self.size:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise RuntimeError('connection pool exhausted')
+        try:
+            return self.backend.connect(self.params)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, connector, broken=False):
+        """
+        借りた接続を返却します
+        @param broken Trueなら接続を再利用せずに閉じる
+        """
+        with self._cond:
+            if broken:
+                self._discard(connector)
+            else:
+                self._idle.append((connector, time.monotonic()))
+                self._evictIdle()
+            self._cond.notify()
+
+    def close(self):
+        """
+        待機中の接続をすべて閉じます
+        貸出中の接続は返却時に通常通りプールへ戻ります
+        """
+        with self._cond:
+            while self._idle:
+                connector, _ = self._idle.pop()
+                self._discard(connector)
+            self._cond.notify_all()
+
+    def _evictIdle(self):
+        limit = time.monotonic() - self.idleTimeout
+        while self._idle and self._idle[0][1] < limit:
+            connector, _ = self._idle.pop(0)
+            self._discard(connector)
+
+    def _discard(self, connector):
+        self._opened -= 1
+        try:
+            connector.close()
+        except self.backend.Error:
+            pass
+
+
+class ConfigCache(object):
+    """
+    設定ファイルの内容をプロセス全体で共有するためのクラスです
+    ファイルは最初に参照したときに読み込み、以降はディクショナリから返します
+    更新日時の確認はCONFIG_CHECK_INTERVAL秒に一度だけ行い、変わっていれば読み直します
+    """
+
+    _entries = {}  # パス -> [更新日時, 最後に確認した時刻, {セクション名: {キー: 値}}]
+    _lock = threading.Lock()
+
+    @classmethod
+    def section(cls, path, section):
+        """
+        指定された設定ファイルのセクションを、キーから値へのディクショナリとして返します
+        セクションが存在しなければKeyErrorを発生させます
+        """
+        entry = cls._entries.get(path)
+        now = time.monotonic()
+        if entry is None or now - entry[1] >= CONFIG_CHECK_INTERVAL:
+            entry = cls._refresh(path, now)
+        return entry[2][section]
+
+    @classmethod
+    def reload(cls, path=None):
+        """
+        保存している内容を捨て、次に参照されたときに読み直させます
+        @param path 対象の設定ファイル。省略すればすべての設定ファイル
+        """
+        with cls._lock:
+            if path is None:
+                cls._entries.clear()
+            else:
+                cls._entries.pop(path, None)
+
+    @classmethod
+    def _refresh(cls, path, now):
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError:
+            mtime = None
+        with cls._lock:
+            entry = cls._entries.get(path)
+            if entry is None or entry[0] != mtime:
+                inifile = ConfigParser()
+                inifile.read(path)
+                sections = dict((name, dict(inifile[name])) for name in inifile.sections())
+                entry = [mtime, now, sections]
+                cls._entries[path] = entry
+            else:
+                entry[1] = now
+            return entry
+
+
+class SchemaCache(object):
+    """
+    テーブル名の一覧と各テーブルの列名の一覧を、接続先ごとにプロセス全体で共有するためのクラスです
+    値はSCHEMA_CACHE_TTL秒の間使い、このプロセスからのテーブルの作成・削除・変更では直ちに捨てます
+    他のプロセスによる変更は、最長でSCHEMA_CACHE_TTL秒の間反映されません
+    """
+
+    _entries = {}  # 接続先 -> {'tables'か('columns', テーブル名): (保存した時刻, 値)}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, target, key):
+        """
+        保存している値を返します。なければ、または古くなっていればNoneを返します
+        """
+        with cls._lock:
+            entry = cls._entries.get(target, {}).get(key)
+        if entry is None or time.monotonic() - entry[0] >= SCHEMA_CACHE_TTL:
+            return None
+        return entry[1]
+
+    @classmethod
+    def put(cls, target, key, value):
+        with cls._lock:
+            cls._entries.setdefault(target, {})[key] = (time.monotonic(), value)
+
+    @classmethod
+    def invalidate(cls, target=None):
+        """
+        保存している値を捨てます
+        @param target 対象の接続先。省略すればすべての接続先
+        """
+        with cls._lock:
+            if target is None:
+                cls._entries.clear()
+            else:
+                cls._entries.pop(target, None)
+
+
+_tableName = r'(?:`[^`]+`|"[^"]+"|\w+)'  # 引用符やバッククォートで囲んだ名前も含む
+# 別名にはjoinやwhereなど、テーブル名の後に続くキーワードを含めない
+_tableAlias = (r'(?:\s+(?:as\s+)?(?!(?:natural|join|inner|left|right|full|outer|cross|straight_join|on|using|where|'
+               r'group|having|order|limit|union|window|for|lock)\b)\w+)?')
+_tableItem = _tableName + _tableAlias
+_readTablePattern = re.compile(r'\b(?:from|join)\s+({0}(?:\s*,\s*{0})*)'.format(_tableItem), re.I)
+_tableItemPattern = re.compile('(' + _tableName + ')' + _tableAlias, re.I)
+_writtenTablePattern = re.compile(
+    r'^\s*(?:insert\s+(?:ignore\s+)?into|replace\s+into|update|delete\s+from|'
+    r'(?:create|drop|alter|truncate)\s+table(?:\s+if\s+(?:not\s+)?exists)?)\s+(' + _tableName + ')', re.I)
+
+
+def _unquote(name):
+    return name.strip('`"').lower()
+
+
+class QueryCache(object):
+    """
+    MySql.query()の結果を、SQLとプレースホルダの値をキーに保存するキャッシュです
+    MySql(result_cache=QueryCache())のように渡したMySqlオブジェクトでのみ使われ(オプトイン)、
+    同じキャッシュを渡したMySqlオブジェクトの間で共有されます
+    保存した結果は、同じキャッシュを使うMySqlオブジェクトがそのテーブルに書き込むと捨てます
+    他のプロセスや、キャッシュを使わないMySqlオブジェクトによる書き込みはttlが過ぎるまで反映されません
+    エントリ数と大きさの上限を超えると、最も長く使われていない結果から捨てます
+    スレッドセーフです
+    """
+
+    def __init__(self, maxEntries=RESULT_CACHE_ENTRIES, maxBytes=RESULT_CACHE_BYTES, ttl=None):
+        """
+        @param maxEntries 保持する結果の数の上限
+        @param maxBytes 保持する結果の大きさの合計の上限。これより大きい結果は保存しない
+        @param ttl 結果を使う最長の秒数。Noneなら書き込まれるか追い出されるまで使う
+        """
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes = 0
+        self._entries = OrderedDict()  # キー -> (保存した時刻, 行のリスト, 列名, 大きさ, (接続先, テーブル名)のタプル)
+        self._byTable = {}  # (接続先, テーブル名) -> そのテーブルを読んだ結果のキーの集合
+        self._readTables = {}  # SQL -> 読むテーブル名のタプル
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        保存している結果を新しいResultTupleにして返します。なければNoneを返します
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl is not None and time.monotonic() - entry[0] >= self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return ResultTuple(entry[1], entry[2])
+
+    def put(self, key, result):
+        """
+        結果を保存します。行のリストは複製せずに共有するため、以後変更しないでください
+        """
+        size = _resultSize(result.rows)
+        if size > self.maxBytes:
+            return
+        target, sql = key[0], key[1]
+        tables = self._tablesOf(sql)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            tableKeys = tuple((target, table) for table in tables)
+            self._entries[key] = (time.monotonic(), result.rows, result.names, size, tableKeys)
+            self.bytes += size
+            for tableKey in tableKeys:
+                self._byTable.setdefault(tableKey, set()).add(key)
+            while len(self._entries) > self.maxEntries or self.bytes > self.maxBytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, target, table):
+        """
+        接続先のテーブルを読んだ結果をすべて捨てます
+        """
+        with self._lock:
+            keys = self._byTable.pop((target, table), ())
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._byTable.clear()
+            self.bytes = 0
+
+    def stats(self):
+        """
+        ヒット数などの統計をディクショナリにして返します
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hitRate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self.bytes,
+            }
+
+    def _tablesOf(self, sql):
+        tables = self._readTables.get(sql)
+        if tables is None:
+            tables = tuple(set(_unquote(item.group(1)) for group in _readTablePattern.findall(sql)
+                               for item in _tableItemPattern.finditer(group)))
+            if len(self._readTables) >= STATEMENT_CACHE_SIZE:
+                self._readTables.clear()
+            self._readTables[sql] = tables
+        return tables
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self.bytes -= entry[3]
+        for tableKey in entry[4]:
+            keys = self._byTable.get(tableKey)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._byTable[tableKey]
+
+
+def _resultSize(rows):
+    """
+    結果の行が使うおおよそのバイト数を返します
+    """
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row)
+        for value in row:
+            size += sys.getsizeof(value)
+    return size
+
+
+def _holderKey(holder):
+    """
+    プレースホルダの値をQueryCacheのキーに使える形にします
+    ディクショナリ(%(name)sのプレースホルダ)はtuple()ではキーしか残らないため、キーと値の組にします
+    """
+    if isinstance(holder, Mapping):
+        return tuple(sorted(holder.items()))
+    return tuple(holder)
+
+
+_writtenTables = {}  # SQL -> 書き込むテーブル名。書き込みでなければNone
+
+
+def _writtenTableOf(sql):
+    if sql in _writtenTables:
+        return _writtenTables[sql]
+    match = _writtenTablePattern.match(sql)
+    table = _unquote(match.group(1)) if match else None
+    if len(_writtenTables) >= STATEMENT_CACHE_SIZE:
+        _writtenTables.clear()
+    _writtenTables[sql] = table
+    return table
+
+
+_defaultInstrument = None
+
+
+def setDefaultInstrument(instrument):
+    """
+    instrumentを指定せずに作成したMySqlオブジェクトが使う計測の受け口を設定します
+    @param instrument db_instrument.Instrumentのサブクラスのオブジェクト。Noneなら計測しない
+    """
+    global _defaultInstrument
+    _defaultInstrument = instrument
+
+
+_statementCache = {}  # (種類, テーブル名, 列名, 条件式) -> 生成済みのSQL
+
+
+def _cacheStatement(key, sql):
+    """
+    生成したSQLを保存して返します
+    文字列の条件式が大量に渡されても膨らみ続けないよう、上限を超えたら捨てて作り直します
+    """
+    if len(_statementCache) >= STATEMENT_CACHE_SIZE:
+        _statementCache.clear()
+    _statementCache[key] = sql
+    return sql
 
 
 class MySql(object):
@@ -28,7 +458,13 @@ class MySql(object):
         key host データベースのホスト名
         key dbname データベース名
         key passwd パスワード名
+        key backend 'mysql'(デフォルト)か'sqlite'
+        key path SQLiteのデータベースファイルのパス(backendが'sqlite'のとき)
         key init_section 上記パラメータを定義した設定ファイルのセクション名
+        key pool_size 接続プールの接続数の上限(接続先ごとに最初に指定された値が使われる)
+        key pool Falseを渡すと接続プールを使わず、毎回新しく接続する
+        key instrument 接続・実行・コミットの時間を受け取るdb_instrument.Instrument。省略すればsetDefaultInstrument()の値
+        key result_cache query()の結果を保存するQueryCache。省略すれば保存しない
         """
 
         if 'user' in args:
@@ -39,17 +475,33 @@ class MySql(object):
             self.dbname = args.get('dbname')
         if 'passwd' in args:
             self.passwd = args.get('passwd')
+        if 'backend' in args:
+            self.backendName = args.get('backend')
+        if 'path' in args:
+            self.path = args.get('path')
         if 'init_section' in args:
             self.init_section = args.get('init_section')
         if 'init_file' in args:
             self.init_file = args.get('init_file')
+        self.poolSize = args.get('pool_size', POOL_SIZE)
+        self.usePool = args.get('pool', True)
+        self.pool = None
+        self.stream = None
+        self.instrument = args.get('instrument', _defaultInstrument)
+        self.autocommit = False
+        self._txDepth = 0  # transaction()の入れ子の深さ
+        self.resultCache = args.get('result_cache')
+        self._written = set()  # コミットしていない書き込みのあったテーブル名
 
     def __enter__(self):
         self.connect('default' if not hasattr(self, 'init_section') else self.init_section)
         return self
 
     def __exit__(self, excType, excValue, traceback):
-        self.close()
+        if excType is None:
+            self.close()
+        else:
+            self._abort()  # 例外で抜けた場合は途中までの変更をコミットしない
         return False
 
     def __iter__(self):
@@ -64,9 +516,40 @@ class MySql(object):
         終了処理を行います
         with文を使わずに利用している場合には明確に呼び出す必要があります
         """
-        self.commit()
+        try:
+            self._commit()
+        except self.backend.Error:
+            self._releaseConnector(broken=True)
+            raise
+        self._releaseConnector()
+
+    def _abort(self):
+        """
+        コミットせずに変更を取り消して接続を返却します
+        取り消しに失敗した接続は再利用しません
+        """
+        SchemaCache.invalidate(self.target)  # 取り消したテーブルの作成などを反映させる
+        self._invalidateWritten()
+        try:
+            self._closeStream()
+            self.connector.rollback()
+        except self.backend.Error:
+            self._releaseConnector(broken=True)
+            return
+        self._releaseConnector()
+
+    def _releaseConnector(self, broken=False):
+        self._closeStream()
         self.cursor.close()
-        self.connector.close()
+        self._txDepth = 0
+        if self.autocommit and not broken:  # プールに戻す接続は次の利用者のために元の設定にする
+            self.backend.setAutocommit(self.connector, False)
+        self.autocommit = False
+        if self.pool is None:
+            self.connector.close()
+        else:
+            self.pool.release(self.connector, broken)
+            self.pool = None
 
     def connect(self, section=None):
         """
@@ -77,18 +560,24 @@ class MySql(object):
         if section is None:
             section = 'default' if not hasattr(self, 'init_section') else self.init_section
 
-        inifile = ConfigParser()
-        inifile.read(INIT_FILE_PATH if not hasattr(self, 'init_file') else self.init_file)
-        if not hasattr(self, 'user'):
-            self.user = inifile[section]['user']
-        if not hasattr(self, 'host'):
-            self.host = inifile[section]['host']
-        if not hasattr(self, 'dbname'):
-            self.dbname = inifile[section]['dbname']
-        if not hasattr(self, 'passwd'):
-            self.passwd = inifile[section]['passwd']
-        self.connector = MySQLdb.connect(host=self.host, db=self.dbname, user=self.user, passwd=self.passwd, charset='utf8', cursorclass=MySQLdb.cursors.DictCursor)
-        self.cursor = self.connector.cursor()
+        initFile = INIT_FILE_PATH if not hasattr(self, 'init_file') else self.init_file
+        if not hasattr(self, 'backendName'):
+            self.backendName = ConfigCache.section(initFile, section).get('backend', 'mysql')
+        self.backend = getBackend(self.backendName)
+        for key in self.backend.params:
+            if not hasattr(self, key):
+                setattr(self, key, ConfigCache.section(initFile, section)[key])
+        params = dict((key, getattr(self, key)) for key in self.backend.params)
+        self.target = self.backend.poolKey(params)  # SchemaCacheのキー
+        start = time.perf_counter()
+        if self.usePool:
+            self.pool = ConnectionPool.get(self.backend, params, self.poolSize)
+            self.connector = self.pool.acquire()
+        else:
+            self.connector = self.backend.connect(params)
+        self.cursor = self.backend.cursor(self.connector)
+        if self.instrument is not None:
+            self.instrument.connected(self, time.perf_counter() - start)
         return self
 
     def update(self, sql, holder=None):
@@ -97,39 +586,77 @@ class MySql(object):
         """
         if holder is None:
             holder = ()
-        print('execute update:', sql, ',', holder)
-        self.cursor.execute(sql, holder)
+        self._execute(sql, holder)
         return self
 
+    def _execute(self, sql, holder=()):
+        """
+        通常のカーソルでSQLを実行します
+        ストリーミング中の結果が残っていると同じ接続で次の文を実行できないため、先に閉じます
+        """
+        self._closeStream()
+        if self.resultCache is not None:
+            self._noteWrite(sql)
+        if self.instrument is None:
+            self.backend.execute(self.cursor, sql, holder)
+            return
+        start = time.perf_counter()
+        self.backend.execute(self.cursor, sql, holder)
+        self.instrument.executed(self, sql, holder, time.perf_counter() - start, self.cursor.rowcount)
+
+    def _noteWrite(self, sql):
+        table = _writtenTableOf(sql)
+        if table is not None:
+            self.resultCache.invalidate(self.target, table)
+            self._written.add(table)
+
+    def _invalidateWritten(self):
+        """
+        コミットか取り消しの後、書き込んだテーブルの結果を捨て直します
+        トランザクション中に保存された、他の接続から見える内容と異なる結果を残さないためです
+        """
+        if self.resultCache is not None:
+            for table in self._written:
+                self.resultCache.invalidate(self.target, table)
+        self._written.clear()
+
+    def _closeStream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
     def updateSet(self, tableName, columns, values, where):
         """
         条件に合致するレコードの値を更新します
-        条件式の値が文字列である場合にはダブルクオーテーションで囲むのを忘れないでください
+        値はプレースホルダで渡すため、クオートやエスケープは不要です
         @param tableName 更新するテーブル名
         @param columns 更新する列名のタプル
         @param values columnsに対応する順序で、更新データ
-        @param where 更新するレコードを指定する条件式
-        """
-        sets = []
-        for column, value in zip(columns, values):
-            sets.append(column + '=' + self._format(value))
-        sql = 'update '
-        sql += tableName
-        sql += ' set '
-        sql += ','.join(sets)
-        sql += ' where ' + where
-        self.update(sql)
+        @param where 更新するレコードを指定する条件。列名から値へのディクショナリ(各条件のandになる)
+                     ex.{'name': 'sample_name'}
+                     従来通り条件式の文字列も渡せるが、その場合は文字列の値をダブルクオーテーションで囲むこと
+        """
+        whereSql, whereHolder = self._where(where)
+        key = ('update', tableName, tuple(columns), whereSql)
+        sql = _statementCache.get(key)
+        if sql is None:
+            sets = ','.join(column + '=%s' for column in columns)
+            sql = _cacheStatement(key, 'update {} set {} where {}'.format(tableName, sets, whereSql))
+        self.update(sql, tuple(values) + whereHolder)
 
     def delete(self, tableName, where):
         """
         条件に合致するレコードを削除します
-        条件式の値が文字列である場合にはダブルクオーテーションで囲むのを忘れないでください
         @param tableName 削除レコードのあるテーブル名
-        @param where 条件式　ex.'name="sample_name"'
-        """
-        sql = 'delete from ' + tableName
-        sql += ' where ' + where
-        self.update(sql)
+        @param where 条件。列名から値へのディクショナリ ex.{'name': 'sample_name'}
+                     条件式の文字列も渡せる ex.'name="sample_name"'
+        """
+        whereSql, whereHolder = self._where(where)
+        key = ('delete', tableName, whereSql)
+        sql = _statementCache.get(key)
+        if sql is None:
+            sql = _cacheStatement(key, 'delete from {} where {}'.format(tableName, whereSql))
+        self.update(sql, whereHolder)
 
     def insert(self, tableName, columns, values):
         """
@@ -137,14 +664,101 @@ class MySql(object):
         @param tableName 追加先のテーブル名
         @param columns 追加する列名のタプル
         @param values columnsに対応する形で、追加するデータのタプル
+        @return 追加されたレコードのAUTO_INCREMENT値
+        """
+        key = ('insert', tableName, tuple(columns))
+        sql = _statementCache.get(key)
+        if sql is None:
+            sql = _cacheStatement(key, 'insert into {} ({}) values ({})'.format(
+                tableName, ','.join(columns), ','.join(['%s'] * len(columns))))
+        self.update(sql, tuple(values))
+        return self.cursor.lastrowid
+
+    def _where(self, where):
         """
-        strColumns = map(str, columns)
-        strValues = map(self._format, values)
-        sql = 'insert into {} ('.format(tableName)
-        sql += ','.join(strColumns) + ') values ('
-        sql += ','.join(strValues) + ')'
-        print('insert sql:' + sql)
-        self.update(sql)
+        条件を表すディクショナリをプレースホルダ付きの条件式と値のタプルにします
+        同じ列の組み合わせからは常に同じ条件式ができるよう、列名順に並べます
+        文字列はそのまま条件式として扱います
+        """
+        if isinstance(where, str):
+            return where, ()
+        columns = sorted(where)
+        return ' and '.join(column + '=%s' for column in columns), tuple(where[column] for column in columns)
+
+    def insertMany(self, tableName, columns, rows, batchSize=INSERT_BATCH_SIZE):
+        """
+        指定されたテーブルに複数のレコードをまとめて追加し、最後に一度だけコミットします
+        transaction()の中で呼ばれた場合のコミットはtransaction()を抜けるときになります
+        batchSize行ずつを複数行のVALUES句を持つひとつのinsert文にして実行するため、往復は行数/batchSize回で済みます
+        返される値はAUTO_INCREMENTの列があり、MySQLではauto_increment_incrementが1で、
+        innodb_autoinc_lock_modeが2(interleaved)でない場合にのみ正確です
+        @param tableName 追加先のテーブル名
+        @param columns 追加する列名のタプル
+        @param rows columnsに対応する形で、追加するデータのタプルを並べたもの(ジェネレータも可)
+        @param batchSize ひとつのinsert文にまとめる行数
+        @return 追加されたレコードのAUTO_INCREMENT値のリスト
+        """
+        head = 'insert into {} ({}) values '.format(tableName, ','.join(columns))
+        rowHolder = '(' + ','.join(['%s'] * len(columns)) + ')'
+        ids = []
+        for batch in _batches(rows, batchSize):
+            self._executeBatch(head, rowHolder, batch)
+            ids.extend(self.backend.insertedIds(self.cursor, len(batch)))
+        self.commit()
+        return ids
+
+    def upsertMany(self, tableName, columns, rows, keyColumns=('name', ), updateColumns=None,
+                   batchSize=INSERT_BATCH_SIZE):
+        """
+        複数のレコードをまとめて追加し、keyColumnsの値が同じレコードがすでにあれば追加する代わりに更新します
+        keyColumnsにはunique制約(またはprimary key)のある列を指定してください
+        insertMany()と同じくbatchSize行ずつひとつの文にまとめ、最後に一度だけコミットします
+        rowsにジェネレータを渡せば、一度に保持するのはbatchSize行だけです
+        @param updateColumns 既存のレコードを更新する列名のタプル。省略すればkeyColumns以外のすべての列
+        @return 処理した行数
+        """
+        if updateColumns is None:
+            updateColumns = tuple(column for column in columns if column not in keyColumns)
+        head = 'insert into {} ({}) values '.format(tableName, ','.join(columns))
+        rowHolder = '(' + ','.join(['%s'] * len(columns)) + ')'
+        tail = ' ' + self.backend.upsertClause(keyColumns, updateColumns)
+        count = 0
+        for batch in _batches(rows, batchSize):
+            self._executeBatch(head, rowHolder, batch, tail)
+            count += len(batch)
+        self.commit()
+        return count
+
+    def updateMany(self, sql, rows, batchSize=INSERT_BATCH_SIZE):
+        """
+        ひとつの更新文をrowsの値の組ごとに実行し、最後に一度だけコミットします
+        batchSize行ずつカーソルのexecutemany()に渡します。insertと違い、存在しない行は追加されません
+        ex.
+            mysql.updateMany('update password_table set password=%s where id=%s', ((password, 1), ...))
+        @param rows sqlのプレースホルダに対応する値のタプルを並べたもの(ジェネレータも可)
+        @return 処理した行数
+        """
+        count = 0
+        for batch in _batches(rows, batchSize):
+            self._executeMany(sql, batch)
+            count += len(batch)
+        self.commit()
+        return count
+
+    def _executeMany(self, sql, batch):
+        self._closeStream()
+        if self.resultCache is not None:
+            self._noteWrite(sql)
+        if self.instrument is None:
+            self.backend.executeMany(self.cursor, sql, batch)
+            return
+        start = time.perf_counter()
+        self.backend.executeMany(self.cursor, sql, batch)
+        self.instrument.executed(self, sql, batch[0], time.perf_counter() - start, self.cursor.rowcount)
+
+    def _executeBatch(self, head, rowHolder, batch, tail=''):
+        holder = [value for row in batch for value in row]
+        self._execute(head + ','.join([rowHolder] * len(batch)) + tail, holder)
 
     def _format(self, val):
         """
@@ -171,21 +785,119 @@ class MySql(object):
         """
         更新処理をデータベースに反映させます
         この処理はclose()に含まれますが、終了処理の前に複数回のコミットを行いたい場合にはこのメソッドを利用してください
+        transaction()の中では何もせず、一番外側のtransaction()を抜けるときにまとめてコミットされます
         """
-        self.connector.commit()
+        if self._txDepth:
+            return self
+        return self._commit()
+
+    def _commit(self):
+        self._closeStream()
+        if self.instrument is None:
+            self.connector.commit()
+        else:
+            start = time.perf_counter()
+            self.connector.commit()
+            self.instrument.committed(self, time.perf_counter() - start)
+        if self._written:
+            self._invalidateWritten()
         return self
 
-    def query(self, sql, holder=None):
+    def setAutocommit(self, autocommit):
+        """
+        Trueにすると、文を実行するたびにコミットされるようになります
+        接続をプールに返却するときにFalseへ戻されます
+        """
+        self._closeStream()
+        self.backend.setAutocommit(self.connector, autocommit)
+        self.autocommit = autocommit
+        return self
+
+    @contextmanager
+    def transaction(self):
+        """
+        with文の中の変更をひとつのトランザクションにまとめます
+        例外なく抜ければコミットし、例外が発生すればそれまでの変更を取り消して例外をそのまま送出します
+        入れ子にした場合、内側はセーブポイントになり、内側の例外は内側の変更だけを取り消します
+        中で呼ばれたcommit()やinsertMany()のコミットは一番外側を抜けるまで行われないため、
+        多数の更新をひとつのコミット(サーバーでは一度のディスク書き込み)にまとめられます
+        ex.
+            with mysql.transaction():
+                mysql.delete('password_table', {'name': 'old'})
+                mysql.insert('password_table', ('name', ), ('new', ))
+        """
+        self._closeStream()
+        depth = self._txDepth
+        if depth == 0:
+            self.backend.begin(self)
+        else:
+            self._execute('savepoint sp{}'.format(depth))
+        self._txDepth = depth + 1
+        try:
+            yield self
+        except BaseException:
+            self._txDepth = depth
+            self._closeStream()
+            SchemaCache.invalidate(self.target)
+            self._invalidateWritten()
+            if depth == 0:
+                self.connector.rollback()
+            else:
+                self._execute('rollback to savepoint sp{}'.format(depth))
+                self._execute('release savepoint sp{}'.format(depth))
+            raise
+        self._txDepth = depth
+        if depth == 0:
+            self._commit()
+        else:
+            self._execute('release savepoint sp{}'.format(depth))
+
+    def inTransaction(self):
+        """
+        transaction()の中であればTrueを返します
+        """
+        return self._txDepth > 0
+
+    def query(self, sql, holder=None, stream=False):
         """
         SELECT文を実行します
+        result_cacheを渡されていれば、同じSQLと値の結果を保存しておき、次からはデータベースに問い合わせずに返します
+        @param stream Trueならサーバー側カーソルを使い、全行の受信を待たずに先頭行から順に取り出す
+                      結果は一度しか走査できず、次にこのオブジェクトでSQLを実行した時点で閉じられる
+                      保存した結果は使わない
         @return 結果を格納した新しいResultTupleオブジェクト
         """
         if holder is None:
             holder = ()
-        self.cursor.execute(sql, holder)
-        result = self.cursor.fetchall()  # ディクショナリ(column : value)のタプル
-        self.resultTuple = ResultTuple(result)
-        self.index = -1
+        if self.resultCache is not None and not stream:
+            key = (self.target, sql, _holderKey(holder))
+            result = self.resultCache.get(key)
+            if result is None:
+                result = self._query(sql, holder)
+                self.resultCache.put(key, result)
+            self.resultTuple = result
+            return result
+        return self._query(sql, holder, stream)
+
+    def _query(self, sql, holder, stream=False):
+        if stream:
+            self._closeStream()
+            start = time.perf_counter()
+            cursor = self.backend.streamCursor(self.connector)
+            self.backend.execute(cursor, sql, holder)
+            self.stream = self.resultTuple = StreamResultTuple(cursor)
+            if self.instrument is not None:  # 最初の行を受け取れるようになるまでの時間。行数は読み終えるまでわからない
+                self.instrument.executed(self, sql, holder, time.perf_counter() - start, -1)
+            return self.resultTuple
+        if self.instrument is None:
+            self._execute(sql, holder)
+            self.resultTuple = ResultTuple.fromCursor(self.cursor)
+            return self.resultTuple
+        self._closeStream()
+        start = time.perf_counter()
+        self.backend.execute(self.cursor, sql, holder)
+        self.resultTuple = ResultTuple.fromCursor(self.cursor)
+        self.instrument.executed(self, sql, holder, time.perf_counter() - start, self.resultTuple.count())
         return self.resultTuple
 
     def next(self):
@@ -216,24 +928,56 @@ class MySql(object):
         """
         指定されたテーブルが持つ列名のリストを返します
         ResultTupleのcolumnsとは異なり、順序は保証され、queryの結果に影響を受けません
+        結果はSchemaCacheに保存し、しばらくの間は問い合わせずに返します
         """
-        self.cursor.execute('desc ' + table)
-        result = self.cursor.fetchall()  # ディクショナリ(column : value)のタプル
-        ret = []
-        for row in result:
-            ret.append(row.get('Field'))
-        return ret
+        columns = SchemaCache.get(self.target, ('columns', table))
+        if columns is None:
+            columns = self.backend.columns(self, table)
+            SchemaCache.put(self.target, ('columns', table), columns)
+        return list(columns)
 
-    def allValues(self, table, column):
+    def allValues(self, table, column, orderBy=None, limit=None, offset=0):
         """
         指定されたテーブルが持つ指定された列の値を全て取り出してリストとして返します
-        """
-        self.cursor.execute('select * from ' + table)
-        result = self.cursor.fetchall()
-        ret = []
-        for row in result:
-            ret.append(row.get(column))
-        return ret
+        データベースからは指定された列だけを取り出します
+        @param orderBy 並び順に使う列名(降順なら'name desc'のように指定)。省略すればデータベースの返す順
+        @param limit 取り出す最大行数。省略すれば全行
+        @param offset limitを指定したときに先頭から読み飛ばす行数
+        """
+        sql = self._selectColumns(table, (column, ), orderBy)
+        holder = ()
+        if limit is not None:
+            sql += ' limit %s offset %s'
+            holder = (limit, offset)
+        self._execute(sql, holder)
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def chunkedValues(self, table, columns, chunkSize=VALUES_CHUNK_SIZE, orderBy=None):
+        """
+        指定された列の値をchunkSize行ずつリストにして順に返すジェネレータです
+        一度の問い合わせの結果をサーバー側カーソルで少しずつ受け取るため、全行を待たずに最初のまとまりを使えます
+        走査中にこのオブジェクトで別のSQLを実行すると、残りの行は破棄されます
+        @param columns 列名。タプルで複数の列を渡した場合は各行が値のタプルになる
+        @param orderBy 並び順に使う列名。省略すればデータベースの返す順
+        """
+        single = isinstance(columns, str)
+        if single:
+            columns = (columns, )
+        result = self.query(self._selectColumns(table, columns, orderBy), stream=True)
+        chunk = []
+        for row in result.tuples():
+            chunk.append(row[0] if single else row)
+            if len(chunk) >= chunkSize:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _selectColumns(self, table, columns, orderBy=None):
+        sql = 'select {} from {}'.format(','.join(columns), table)
+        if orderBy:
+            sql += ' order by ' + orderBy
+        return sql
 
     def values(self, column=None):
         """
@@ -245,23 +989,67 @@ class MySql(object):
     def tables(self):
         """
         テーブル名一覧のリストを返します
+        結果はSchemaCacheに保存し、しばらくの間は問い合わせずに返します
         """
-        self.cursor.execute('show tables ')
-        result = self.cursor.fetchall()  # ディクショナリ(column : value)のタプル
-        ret = []
-        for row in result:
-            ret.append(list(row.values())[0])
-        return ret
+        return list(self._tables())
+
+    def _tables(self):
+        tables = SchemaCache.get(self.target, 'tables')
+        if tables is None:
+            tables = tuple(self.backend.tables(self))
+            SchemaCache.put(self.target, 'tables', tables)
+        return tables
 
     def hasTable(self, tableName):
         """
         引数で渡されたテーブルが存在すればTrue、そうでなければFalseを返します
+        tables()と同じ保存した一覧から調べます
         """
-        self.cursor.execute('show tables where Tables_in_{} like %s'.format(self.dbname), (tableName, ))
-        if self.cursor.fetchone():
-            return True
-        else:
-            return False
+        return tableName in self._tables()
+
+    def hasIndex(self, tableName, indexName):
+        """
+        テーブルに指定された名前のインデックスがあればTrue、そうでなければFalseを返します
+        """
+        return self.backend.hasIndex(self, tableName, indexName)
+
+    def createIndex(self, tableName, indexName, columns):
+        """
+        テーブルにインデックスを追加します。MySQLでは追加中もテーブルの読み書きを止めません
+        @param columns インデックスにする列名のタプル
+        """
+        self.backend.createIndex(self, tableName, indexName, columns)
+
+    def createSearchIndex(self, tableName, columns):
+        """
+        search()で使う全文検索のインデックスを作成します。すでにあれば何もしません
+        MySQLではFULLTEXTインデックス、SQLiteではFTS5の仮想テーブルとそれを更新するトリガーを作成します
+        @param columns 検索の対象にする列名のタプル
+        """
+        self.backend.createSearchIndex(self, tableName, columns)
+        SchemaCache.invalidate(self.target)
+
+    def search(self, tableName, text, columns=('name', 'memo'), limit=SEARCH_LIMIT):
+        """
+        createSearchIndex()で作成したインデックスを使い、textの語をすべて含む行を検索します
+        入力途中でも検索できるよう、最後の語だけは前方一致で扱います
+        暗号化された列の内容は検索できません
+        @param columns createSearchIndex()に渡した列名のタプル
+        @return id, name, scoreの列を持ち、関連の高い順に並んだResultTuple
+        """
+        terms = self.backend.searchTerms(text)
+        if not terms:
+            return ResultTuple([], ('id', 'name', 'score'))
+        sql, holder = self.backend.searchQuery(tableName, columns, terms, limit)
+        return self.query(sql, holder)
+
+    def alterColumn(self, tableName, column, definition):
+        """
+        列のデータ型を変更します
+        @param definition 'varchar(255)'のような新しいデータ型とオプション
+        """
+        self.backend.alterColumn(self, tableName, column, definition)
+        SchemaCache.invalidate(self.target)
 
     def createTable(self, tableName, *args):
         """
@@ -271,40 +1059,92 @@ class MySql(object):
         sql = 'create table '
         sql += tableName
         sql += '('
-        columnDatas = [' '.join(columnData) for columnData in args]
+        columnDatas = [self.backend.columnDefinition(columnData) for columnData in args]
         sql += ','.join(columnDatas)
         sql += ')'
         self.update(sql)
+        SchemaCache.invalidate(self.target)
 
     def deleteTable(self, tableName):
         """
         指定されたテーブルを削除します
         """
-        self.cursor.execute('drop table {}'.format(tableName))
+        self._execute('drop table {}'.format(tableName))
+        SchemaCache.invalidate(self.target)
+
+
+def _batches(rows, size):
+    """
+    rowsをsize行ずつのリストにして返すジェネレータ
+    """
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+_columnIndexes = {}  # 列名のタプル -> 列名から位置へのディクショナリ。同じ列の結果同士で共有する
+
+
+def _columnIndex(names):
+    index = _columnIndexes.get(names)
+    if index is None:
+        if len(_columnIndexes) >= STATEMENT_CACHE_SIZE:
+            _columnIndexes.clear()
+        index = _columnIndexes[names] = dict((name, i) for i, name in enumerate(names))
+    return index
+
+
+def _cursorColumns(cursor):
+    if cursor.description is None:
+        return ()
+    return tuple(description[0] for description in cursor.description)
 
 
 class ResultTuple(object):
     """
     データベースへの問い合わせ結果を取り出すためのクラス
+    各行は値のタプルとして保持し、列名から位置へのディクショナリを全行で共有します
     """
 
-    def __init__(self, resultTuple):
-        self.resultTuple = resultTuple
+    __slots__ = ('rows', 'names', 'columnIndex', 'index', '_columnValues')
+
+    def __init__(self, rows, names):
+        """
+        @param rows 各行の値のタプルを並べたもの
+        @param names 列名のタプル
+        """
+        self.rows = rows
+        self.names = tuple(names)
+        self.columnIndex = _columnIndex(self.names)
         self.index = -1
+        self._columnValues = None  # 列名 -> values()で作った全行の値のリスト
+
+    @classmethod
+    def fromCursor(cls, cursor):
+        """
+        実行済みのカーソルから全行を受け取って作成します
+        """
+        return cls(cursor.fetchall(), _cursorColumns(cursor))
 
     def __iter__(self):
         """
         最新結果の各行の列名から値へのディクショナリをイテレートするイテレータを返します
         このオブジェクトによる元のオブジェクトのカーソル位置への影響はありません
         """
-        return self.clone()
+        names = self.names
+        return (dict(zip(names, row)) for row in self.rows)
 
     def next(self):
         """
         カーソルを次の行に進めます
         @return 無事にカーソルが進めばtrue
         """
-        isNext = self.index < len(self.resultTuple) - 1
+        isNext = self.index < len(self.rows) - 1
         if not isNext:
             return False
         self.index += 1
@@ -315,18 +1155,18 @@ class ResultTuple(object):
         現在行の指定された列の値を取り出します
         @param default 値が存在しなかった場合のデフォルト値
         """
-        if not len(self.resultTuple):
+        if not len(self.rows):
             raise RuntimeError('not found column because no selected data')
-        if column in self.resultTuple[self.index]:
-            return self.resultTuple[self.index][column]
-        else:
+        position = self.columnIndex.get(column)
+        if position is None:
             return default
+        return self.rows[self.index][position]
 
     def count(self):
         """
         結果の全行数を返します
         """
-        return len(self.resultTuble)
+        return len(self.rows)
 
     def reset(self):
         """
@@ -337,32 +1177,159 @@ class ResultTuple(object):
 
     def __next__(self):
         if self.next():
-            return self.resultTuple[self.index]
+            return dict(zip(self.names, self.rows[self.index]))
         raise StopIteration()
 
     def clone(self):
-        return ResultTuple(self.resultTuple)
+        """
+        同じ結果を共有し、カーソルだけが独立したResultTupleを返します
+        """
+        return ResultTuple(self.rows, self.names)
+
+    def tuples(self):
+        """
+        各行の値のタプルをイテレートします
+        """
+        return iter(self.rows)
 
     def columns(self):
         """
         列名のリストを返します
         ただし、問い合わせた結果取得したレコードがひとつもない状態で呼び出された際には例外を発生させます
         """
-        if not len(self.resultTuple):
+        if not len(self.rows):
             raise RuntimeError('not found column because no data')
-        return self.resultTuple[self.index].keys()
+        return list(self.names)
 
     def values(self, column=None):
         """
         指定した列の値をリストにして返します
+        列ごとの値は最初に求めたものを保存しておき、呼ばれるたびにその複製を返します
+        列名が省略された場合は、現在行の値をリストにして返します
+        """
+        if not column:
+            return [] if not len(self.rows) else list(self.rows[self.index])
+        if self._columnValues is None:
+            self._columnValues = {}
+        values = self._columnValues.get(column)
+        if values is None:
+            position = self.columnIndex[column]
+            values = self._columnValues[column] = [row[position] for row in self.rows]
+        return list(values)  # 保存した値を呼び出し元の変更から守る
+
+
+class StreamResultTuple(ResultTuple):
+    """
+    サーバー側カーソルから少しずつ行を受け取るResultTupleです
+    全行をメモリに保持しないため、大きなテーブルでもメモリ使用量は一定で、先頭行はすぐに取り出せます
+    その代わり先頭から一度しか走査できず、reset()やclone()は使えません
+    """
+
+    __slots__ = ('cursor', 'pending', 'row', 'exhausted')
+
+    def __init__(self, cursor):
+        ResultTuple.__init__(self, (), _cursorColumns(cursor))
+        self.cursor = cursor
+        self.pending = self._fetch()
+        self.row = None
+        self.exhausted = False
+
+    def _fetch(self):
+        while True:
+            rows = self.cursor.fetchmany(STREAM_FETCH_SIZE)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+        self.exhausted = True
+
+    def __iter__(self):
+        """
+        残りの行の列名から値へのディクショナリをイテレートします
+        通常のResultTupleと異なり、このオブジェクト自身のカーソルも進みます
+        """
+        return self
+
+    def next(self):
+        """
+        カーソルを次の行に進めます
+        @return 無事にカーソルが進めばtrue
+        """
+        row = next(self.pending, None)
+        if row is None:
+            self.row = None
+            return False
+        self.row = row
+        self.index += 1
+        return True
+
+    def get(self, column, default=None):
+        """
+        現在行の指定された列の値を取り出します
+        next()を呼ぶ前であれば先頭行を読み込みます
+        @param default 値が存在しなかった場合のデフォルト値
+        """
+        if self.row is None and self.index == -1:
+            self.next()
+        if self.row is None:
+            raise RuntimeError('not found column because no selected data')
+        position = self.columnIndex.get(column)
+        if position is None:
+            return default
+        return self.row[position]
+
+    def count(self):
+        """
+        結果の全行数を返します
+        行数は最後まで読み終えるまでわからないため、途中で呼び出すと例外を発生させます
+        """
+        if not self.exhausted:
+            raise RuntimeError('row count is unknown until the stream is exhausted')
+        return self.index + 1
+
+    def reset(self):
+        raise RuntimeError('stream result cannot be reset')
+
+    def __next__(self):
+        if self.next():
+            return dict(zip(self.names, self.row))
+        raise StopIteration()
+
+    def clone(self):
+        raise RuntimeError('stream result cannot be cloned')
+
+    def tuples(self):
+        """
+        残りの各行の値のタプルをイテレートします。このオブジェクト自身のカーソルも進みます
+        """
+        while self.next():
+            yield self.row
+
+    def columns(self):
+        """
+        列名のリストを返します
+        """
+        return list(self.names)
+
+    def values(self, column=None):
+        """
+        指定した列の値を、現在行より後の残りの行すべてについてリストにして返します
         列名が省略された場合は、現在行の値をリストにして返します
         """
         if not column:
-            return [] if not len(self.resultTuple) else self.resultTuple[self.index].values()
-        ret = []
-        for row in self.resultTuple:
-            ret.append(row[column])
-        return ret
+            return [] if self.row is None else list(self.row)
+        position = self.columnIndex[column]
+        return [row[position] for row in self.tuples()]
+
+    def close(self):
+        """
+        サーバー側カーソルを閉じます。読み残した行は破棄されます
+        """
+        if self.cursor is not None:
+            self.cursor.close()
+            self.cursor = None
+            self.row = None
+            self.pending = iter(())
 
 
 # 実行例
@@ -441,6 +1408,17 @@ if __name__ == '__main__':
         """
         print(obj.allValues('file_table', 'filename'))
         """
+        行数が多い場合は、並び順を指定して一定行数ずつ受け取ることもできる
+        """
+        for filenames in obj.chunkedValues('file_table', 'filename', chunkSize=100, orderBy='filename'):
+            print(filenames)
+        """
+        stream=Trueを渡すとサーバー側カーソルから少しずつ受け取るため、大きなテーブルでもメモリを消費しない
+        ただし一度しか走査できず、reset()もできない
+        """
+        for dic in obj.query('select * from file_table', stream=True):
+            print('streamDic:', dic)
+        """
         テーブル名の一覧も取得できる
         """
         print(obj.tables())
@@ -471,11 +1449,33 @@ if __name__ == '__main__':
                  'memo', 'count'),
                 ('sample2', 'password22', datetime.datetime.today(),
                  'insert from database3.4', 26))
-            mysql.delete('create_sample_table', 'name="sample2"')
+            mysql.delete('create_sample_table', {'name': 'sample2'})
+            """
+            複数行をまとめて追加する場合はinsertMany()を使うと速い。追加された行のidのリストが返る
+            """
+            print(mysql.insertMany(
+                'create_sample_table',
+                ('name', 'password', 'registered', 'memo', 'count'),
+                [('bulk{}'.format(i), 'password', datetime.datetime.today(), 'insert from insertMany', i)
+                 for i in range(10)]
+            ))
+            """
+            transaction()の中の変更はまとめてコミットされ、例外が発生すればすべて取り消される
+            """
+            with mysql.transaction():
+                mysql.updateSet('create_sample_table', ('count', ), (0, ), {'name': 'sample'})
+                mysql.delete('create_sample_table', {'name': 'bulk0'})
         else:
             mysql.deleteTable('create_sample_table')
             print(mysql.hasTable('create_sample_table'))
 
+    """
+    backend='sqlite'を指定すればMySQLサーバーなしでSQLiteのファイルを同じように使える
+    設定ファイルのセクションにbackend = sqliteとpath = ...を書いてもよい
+    """
+    with MySql(backend='sqlite', path='./sample.sqlite3') as lite:
+        print(lite.tables())
+
     # new interface
     # db.from(tableName).select(columns..).where('id','=','5').andWhere('score','>','80').orWhere('sex','=','female').execute()
     # where, orWhere
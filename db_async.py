@@ -0,0 +1,125 @@
+#! /usr/bin/python3.7
+# -*- coding: utf-8 -*-
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from database3_4 import INSERT_BATCH_SIZE, POOL_SIZE, SEARCH_LIMIT, MySql
+
+"""
+database3_4.MySqlの操作をasyncioのコルーチンとして使うためのクラス
+
+各操作は上限のあるスレッドプール上で接続プールから接続を借りて実行するため、
+同時に待っている複数の問い合わせはネットワークの待ち時間が重なり、合計されません
+ex.
+    async with AsyncMySql(init_section='password') as db:
+        results = await asyncio.gather(*[
+            db.query('select * from password_table where name=%s', (name, )) for name in names])
+"""
+
+ASYNC_WORKERS = POOL_SIZE  # 同時に実行する操作の数。接続プールの上限を超えた分は接続が空くのを待つ
+
+
+class AsyncMySql(object):
+    """
+    MySqlと同じ操作を提供する非同期版のクラスです
+    操作ごとに接続を借りて実行し、終了時にコミットして返却します(DbWorkerのタスクと同じ)
+    そのため操作をまたいだトランザクションはなく、複数の操作をまとめるにはrun()を使ってください
+    結果はMySqlと同じResultTupleで返します。ストリーミング(stream=True)は使えません
+    """
+
+    def __init__(self, max_workers=ASYNC_WORKERS, **args):
+        """
+        @param max_workers 同時に実行する操作の数
+        @param args MySqlに渡す引数。pool_sizeを省略すればmax_workersを使う
+        """
+        args.setdefault('pool_size', max_workers)
+        self.dbArgs = args
+        self.maxWorkers = max_workers
+        self._executor = None
+
+    async def __aenter__(self):
+        return self.open()
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.close()
+        return False
+
+    def open(self):
+        """
+        操作を実行するスレッドプールを作ります
+        async with文を使わずに利用している場合には明確に呼び出す必要があります
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.maxWorkers, thread_name_prefix='AsyncMySql')
+        return self
+
+    async def close(self):
+        """
+        実行中の操作が終わるのを待ってスレッドプールを終了します
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await asyncio.get_running_loop().run_in_executor(None, executor.shutdown)
+
+    async def run(self, func):
+        """
+        MySqlオブジェクトをひとつ引数に取る関数をワーカースレッドで実行し、その戻り値を返します
+        関数の中の変更はひとつのトランザクションになり、例外が発生すればすべて取り消されます
+        """
+        if self._executor is None:
+            raise RuntimeError('AsyncMySql is not open')
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, func)
+
+    def _call(self, func):
+        with MySql(**self.dbArgs) as mysql:
+            return func(mysql)
+
+    async def query(self, sql, holder=None):
+        """
+        SELECT文を実行し、結果を格納したResultTupleを返します
+        """
+        return await self.run(lambda mysql: mysql.query(sql, holder))
+
+    async def update(self, sql, holder=None):
+        """
+        結果を伴わない更新処理全般を行います(insert, update etc)
+        """
+        await self.run(lambda mysql: mysql.update(sql, holder))
+
+    async def updateSet(self, tableName, columns, values, where):
+        await self.run(lambda mysql: mysql.updateSet(tableName, columns, values, where))
+
+    async def delete(self, tableName, where):
+        await self.run(lambda mysql: mysql.delete(tableName, where))
+
+    async def insert(self, tableName, columns, values):
+        """
+        @return 追加されたレコードのAUTO_INCREMENT値
+        """
+        return await self.run(lambda mysql: mysql.insert(tableName, columns, values))
+
+    async def insertMany(self, tableName, columns, rows, batchSize=INSERT_BATCH_SIZE):
+        """
+        MySql.insertMany()と同じくbatchSize行ずつまとめて追加します。rowsはワーカースレッドで読み出されます
+        @return 追加されたレコードのAUTO_INCREMENT値のリスト
+        """
+        return await self.run(lambda mysql: mysql.insertMany(tableName, columns, rows, batchSize))
+
+    async def upsertMany(self, tableName, columns, rows, keyColumns=('name', ), updateColumns=None,
+                         batchSize=INSERT_BATCH_SIZE):
+        """
+        @return 処理した行数
+        """
+        return await self.run(
+            lambda mysql: mysql.upsertMany(tableName, columns, rows, keyColumns, updateColumns, batchSize))
+
+    async def updateMany(self, sql, rows, batchSize=INSERT_BATCH_SIZE):
+        """
+        @return 処理した行数
+        """
+        return await self.run(lambda mysql: mysql.updateMany(sql, rows, batchSize))
+
+    async def allValues(self, table, column, orderBy=None, limit=None, offset=0):
+        return await self.run(lambda mysql: mysql.allValues(table, column, orderBy, limit, offset))
+
+    async def search(self, tableName, text, columns=('name', 'memo'), limit=SEARCH_LIMIT):
+        return await self.run(lambda mysql: mysql.search(tableName, text, columns, limit))
@@ -0,0 +1,316 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import datetime
+import re
+import sqlite3
+
+"""
+MySqlクラスが利用するデータベースごとの処理
+
+MySqlクラスはSQLを%sのプレースホルダを使ったMySQLの書式で組み立て、接続・カーソル・データベース固有の問い合わせを
+ここにあるバックエンドに任せます
+設定ファイルのセクションにbackend = sqliteとpath = <ファイルのパス>を書けば、MySQLサーバーの代わりに
+SQLiteのファイルを使います(backendを省略した場合はmysql)
+"""
+
+SQLITE_PRAGMAS = (
+    'pragma journal_mode=WAL',  # 読み込みが書き込みを待たない
+    'pragma synchronous=NORMAL',  # WALではNORMALでもコミット済みのデータは壊れない
+    'pragma temp_store=MEMORY',
+    'pragma cache_size=-16000',  # 16MB
+    'pragma mmap_size=268435456',  # 256MB
+    'pragma busy_timeout=5000',
+    'pragma foreign_keys=ON',
+)
+
+
+_searchWord = re.compile(r'\w+')
+ENCRYPTED_TERM = 'enc1'  # vault.PREFIXの語。暗号化した値はこの語で始まるため、検索しても全件に一致するだけになる
+
+
+class Backend(object):
+    """
+    バックエンドの共通部分です
+    """
+
+    name = None
+    params = ()  # 接続に必要な設定の名前
+    Error = Exception  # このバックエンドのドライバが発生させる例外の基底クラス
+
+    def poolKey(self, params):
+        """
+        接続プールを共有してよい接続先を表すキーを返します
+        """
+        return (self.name, ) + tuple(params[key] for key in self.params)
+
+    def execute(self, cursor, sql, holder):
+        cursor.execute(sql, holder)
+
+    def executeMany(self, cursor, sql, rows):
+        cursor.executemany(sql, rows)
+
+    def begin(self, mysql):
+        """
+        トランザクションを開始します
+        """
+        mysql._execute('start transaction')
+
+    def insertedIds(self, cursor, count):
+        """
+        直前に実行した複数行のinsert文で追加された行のidのリストを返します
+        """
+        firstId = cursor.lastrowid  # 複数行のinsertでは最初の行の値になる
+        return list(range(firstId, firstId + count))
+
+    def columnDefinition(self, columnData):
+        """
+        createTable()に渡された列の定義のタプルを、create table文の一部にします
+        """
+        return ' '.join(columnData)
+
+    def searchTerms(self, text):
+        """
+        検索文字列を語のリストにします。全文検索の演算子として解釈される記号は取り除きます
+        インデックスに入った暗号化した値に一致しないよう、ENCRYPTED_TERMで始まる語も取り除きます
+        """
+        return [term for term in _searchWord.findall(text) if not term.lower().startswith(ENCRYPTED_TERM)]
+
+
+class MySqlBackend(Backend):
+    """
+    MySQLdbを使ってMySQLサーバーに接続するバックエンドです
+    """
+
+    name = 'mysql'
+    params = ('host', 'dbname', 'user', 'passwd')
+
+    def __init__(self):
+        import MySQLdb.cursors  # SQLiteだけを使う環境ではMySQLdbを必要としない
+        self.driver = MySQLdb
+        self.Error = MySQLdb.Error
+
+    def poolKey(self, params):
+        return (self.name, params['host'], params['dbname'], params['user'])
+
+    def connect(self, params):
+        return self.driver.connect(
+            host=params['host'], db=params['dbname'], user=params['user'], passwd=params['passwd'],
+            charset='utf8')
+
+    def ping(self, connector):
+        try:
+            connector.ping()
+            return True
+        except self.Error:
+            return False
+
+    def cursor(self, connector):
+        return connector.cursor()
+
+    def streamCursor(self, connector):
+        return connector.cursor(self.driver.cursors.SSCursor)
+
+    def setAutocommit(self, connector, autocommit):
+        connector.autocommit(autocommit)
+
+    def upsertClause(self, keyColumns, updateColumns):
+        """
+        insert文の後ろにつけ、keyColumnsが重複する行をupdateColumnsの更新に変える句を返します
+        MySQLは重複したunique制約を自分で判断するため、keyColumnsは使いません
+        """
+        if not updateColumns:
+            return 'on duplicate key update {0}={0}'.format(keyColumns[0])
+        return 'on duplicate key update ' + ','.join('{0}=values({0})'.format(column) for column in updateColumns)
+
+    def tables(self, mysql):
+        mysql._execute('show tables')
+        return [row[0] for row in mysql.cursor.fetchall()]
+
+    def columns(self, mysql, table):
+        mysql._execute('desc ' + table)
+        return [row[0] for row in mysql.cursor.fetchall()]  # 先頭がField
+
+    def hasIndex(self, mysql, table, name):
+        mysql._execute('show index from {} where Key_name=%s'.format(table), (name, ))
+        return mysql.cursor.fetchone() is not None
+
+    def createIndex(self, mysql, table, name, columns):
+        # InnoDBのオンラインDDLで作成し、作成中も読み書きを受け付ける
+        mysql._execute('alter table {} add index {} ({}), algorithm=inplace, lock=none'.format(
+            table, name, ','.join(columns)))
+
+    def createSearchIndex(self, mysql, table, columns):
+        name = table + '_search'
+        if not self.hasIndex(mysql, table, name):
+            # FULLTEXTインデックスの作成中は書き込みを待たせるが、読み込みは止めない
+            mysql._execute('alter table {} add fulltext index {} ({}), algorithm=inplace, lock=shared'.format(
+                table, name, ','.join(columns)))
+
+    def searchQuery(self, table, columns, terms, limit):
+        match = 'match({}) against (%s in boolean mode)'.format(','.join(columns))
+        query = ' '.join('+' + term for term in terms) + '*'
+        sql = 'select id, name, {0} as score from {1} where {0} order by score desc limit %s'.format(match, table)
+        return sql, (query, query, limit)
+
+    def alterColumn(self, mysql, table, column, definition):
+        try:
+            mysql._execute('alter table {} modify {} {}, algorithm=inplace, lock=none'.format(
+                table, column, definition))
+        except self.Error:
+            # varcharの長さを表すバイト数が変わる場合などはその場で変更できないため、コピーして作り直す
+            # その間も読み込みは止めない
+            mysql._execute('alter table {} modify {} {}, algorithm=copy, lock=shared'.format(
+                table, column, definition))
+
+
+class SqliteBackend(Backend):
+    """
+    標準ライブラリのsqlite3を使い、ローカルのファイルに保存するバックエンドです
+    WALモードで開くため、読み込みは書き込み中でも待たされません
+    """
+
+    name = 'sqlite'
+    params = ('path', )
+
+    def __init__(self):
+        self.Error = sqlite3.Error
+        self._sql = {}  # MySQLの書式のSQL -> SQLiteの書式のSQL
+        sqlite3.register_adapter(datetime.datetime, lambda value: value.strftime('%Y-%m-%d %H:%M:%S'))
+        sqlite3.register_converter('datetime', self._toDatetime)
+
+    @staticmethod
+    def _toDatetime(value):
+        value = value.decode()
+        for form in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S.%f'):
+            try:
+                return datetime.datetime.strptime(value, form)
+            except ValueError:
+                pass
+        return value
+
+    def connect(self, params):
+        # 接続はプールを通じて一度にひとつのスレッドだけが使うため、スレッドをまたいで使えるようにする
+        connector = sqlite3.connect(
+            params['path'], detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        for pragma in SQLITE_PRAGMAS:
+            connector.execute(pragma)
+        return connector
+
+    def ping(self, connector):
+        return True
+
+    def cursor(self, connector):
+        return connector.cursor()
+
+    def streamCursor(self, connector):
+        return connector.cursor()  # sqlite3のカーソルは要求された分だけ行を読み込む
+
+    def setAutocommit(self, connector, autocommit):
+        # isolation_levelがNoneならsqlite3はbeginを補わず、各文がそのまま確定する
+        connector.isolation_level = None if autocommit else ''
+
+    def upsertClause(self, keyColumns, updateColumns):
+        conflict = 'on conflict({}) do '.format(','.join(keyColumns))
+        if not updateColumns:
+            return conflict + 'nothing'
+        return conflict + 'update set ' + ','.join('{0}=excluded.{0}'.format(column) for column in updateColumns)
+
+    def begin(self, mysql):
+        if mysql.connector.in_transaction:  # MySQLのstart transactionと同じく、未コミットの変更は先に確定する
+            mysql.connector.commit()
+        mysql._execute('begin')
+
+    def execute(self, cursor, sql, holder):
+        cursor.execute(self.convert(sql), holder)
+
+    def executeMany(self, cursor, sql, rows):
+        cursor.executemany(self.convert(sql), rows)
+
+    def convert(self, sql):
+        """
+        %sのプレースホルダを?に置き換えます
+        """
+        converted = self._sql.get(sql)
+        if converted is None:
+            converted = sql.replace('%s', '?').replace('%%', '%')
+            if len(self._sql) < 1024:
+                self._sql[sql] = converted
+        return converted
+
+    def insertedIds(self, cursor, count):
+        lastId = cursor.lastrowid  # 複数行のinsertでは最後の行の値になる
+        return list(range(lastId - count + 1, lastId + 1))
+
+    def columnDefinition(self, columnData):
+        # SQLiteではinteger primary keyがAUTO_INCREMENTの役割を果たす
+        if 'auto_increment' in columnData:
+            return columnData[0] + ' integer primary key autoincrement'
+        return ' '.join(columnData)
+
+    def tables(self, mysql):
+        mysql._execute("select name from sqlite_master where type='table' and name not like 'sqlite_%%' order by name")
+        return [row[0] for row in mysql.cursor.fetchall()]
+
+    def columns(self, mysql, table):
+        mysql._execute('pragma table_info({})'.format(table))
+        return [row[1] for row in mysql.cursor.fetchall()]  # cid, name, type, ...の順
+
+    def hasIndex(self, mysql, table, name):
+        mysql._execute("select name from sqlite_master where type='index' and tbl_name=%s and name=%s",
+                       (table, name))
+        return mysql.cursor.fetchone() is not None
+
+    def createIndex(self, mysql, table, name, columns):
+        mysql._execute('create index if not exists {} on {} ({})'.format(name, table, ','.join(columns)))
+
+    def alterColumn(self, mysql, table, column, definition):
+        pass  # SQLiteは列の型の長さを制限しないため、変更する必要がない
+
+    def createSearchIndex(self, mysql, table, columns):
+        # 元のテーブルを内容として参照するFTS5の転置インデックスを作り、トリガーで元のテーブルと同期させる
+        name = table + '_search'
+        if mysql.hasTable(name):
+            return
+        names = ','.join(columns)
+        newValues = ','.join('new.' + column for column in columns)
+        oldValues = ','.join('old.' + column for column in columns)
+        # prefixで2文字と3文字の前方一致用の索引も作り、入力途中の語の検索で語の一覧を走査しないようにする
+        mysql._execute("create virtual table {} using fts5({}, content='{}', content_rowid='id', prefix='2 3')".format(
+            name, names, table))
+        mysql._execute('create trigger {0}_insert after insert on {1} begin '
+                       'insert into {0}(rowid, {2}) values (new.id, {3}); end'.format(name, table, names, newValues))
+        mysql._execute('create trigger {0}_delete after delete on {1} begin '
+                       "insert into {0}({0}, rowid, {2}) values ('delete', old.id, {3}); end".format(
+                           name, table, names, oldValues))
+        mysql._execute('create trigger {0}_update after update on {1} begin '
+                       "insert into {0}({0}, rowid, {2}) values ('delete', old.id, {3}); "
+                       'insert into {0}(rowid, {2}) values (new.id, {4}); end'.format(
+                           name, table, names, oldValues, newValues))
+        mysql._execute("insert into {0}({0}) values ('rebuild')".format(name))  # 既存の行を索引する
+
+    def searchQuery(self, table, columns, terms, limit):
+        name = table + '_search'
+        query = ' '.join('"{}"'.format(term) for term in terms) + '*'
+        # rankはbm25()の値で、関連が高いほど小さい
+        sql = ('select {1}.id, {1}.name, -{0}.rank as score from {0} join {1} on {1}.id = {0}.rowid '
+               'where {0} match %s order by {0}.rank limit %s').format(name, table)
+        return sql, (query, limit)
+
+
+_backendClasses = {
+    'mysql': MySqlBackend,
+    'sqlite': SqliteBackend,
+}
+_backends = {}
+
+
+def getBackend(name):
+    """
+    名前に対応するバックエンドを返します
+    """
+    backend = _backends.get(name)
+    if backend is None:
+        if name not in _backendClasses:
+            raise ValueError('unknown backend: {}'.format(name))
+        backend = _backends[name] = _backendClasses[name]()
+    return backend
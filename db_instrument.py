@@ -0,0 +1,165 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import logging
+import re
+import threading
+
+"""
+MySqlオブジェクトの接続・SQLの実行・コミットにかかった時間を受け取るためのクラス
+
+MySql(instrument=QueryStats(slowThreshold=0.1))のように渡すか、database3_4.setDefaultInstrument()で
+全てのMySqlオブジェクトに設定します。設定しなければ計測は行われません
+"""
+
+HISTOGRAM_BOUNDS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)  # ヒストグラムの各区間の上限(秒)
+SHAPE_CACHE_SIZE = 1024  # 正規化したSQLを保存しておく数
+
+_literal = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"|\b\d+(?:\.\d+)?\b")
+_placeholders = re.compile(r'\((?:\s*\?\s*,)+\s*\?\s*\)')
+_valueGroups = re.compile(r'\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+')
+_spaces = re.compile(r'\s+')
+
+
+def normalizeSql(sql):
+    """
+    値だけが異なるSQLが同じ文字列になるよう、リテラルとプレースホルダを?に置き換えます
+    複数行のVALUES句やin句は行数や要素数によらずひとつにまとめます
+    """
+    shape = _spaces.sub(' ', sql.strip())
+    shape = shape.replace('%s', '?')
+    shape = _literal.sub('?', shape)
+    shape = _placeholders.sub('(?...)', shape)
+    shape = _valueGroups.sub('(?...),...', shape)
+    return shape
+
+
+def redact(holder):
+    """
+    ログに残すため、バインドする値をその型名に置き換えます
+    """
+    return '(' + ', '.join(type(value).__name__ for value in holder) + ')'
+
+
+class Instrument(object):
+    """
+    計測値を受け取るクラスの基底クラスです。必要なメソッドだけを上書きしてください
+    MySqlオブジェクトは複数のスレッドから使われることがあるため、スレッドセーフに実装してください
+    """
+
+    def connected(self, mysql, seconds):
+        """
+        接続(プールからの貸出を含む)にかかった時間を受け取ります
+        """
+        pass
+
+    def executed(self, mysql, sql, holder, seconds, rowcount):
+        """
+        SQLの実行にかかった時間を受け取ります
+        @param rowcount 問い合わせなら取得した行数、更新なら影響を受けた行数。不明なら-1
+        """
+        pass
+
+    def committed(self, mysql, seconds):
+        """
+        コミットにかかった時間を受け取ります
+        """
+        pass
+
+
+class Timing(object):
+    """
+    ひとつの種類の処理の回数・合計時間・最大時間・ヒストグラムを集計するクラス
+    """
+
+    __slots__ = ('count', 'total', 'max', 'rows', 'histogram')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.histogram = [0] * (len(HISTOGRAM_BOUNDS) + 1)  # 最後の区間は上限なし
+
+    def add(self, seconds, rows=0):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        if rows > 0:
+            self.rows += rows
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if seconds <= bound:
+                self.histogram[i] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+    def report(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else 0.0,
+            'max': self.max,
+            'rows': self.rows,
+            'histogram': dict(zip([str(bound) for bound in HISTOGRAM_BOUNDS] + ['inf'], self.histogram)),
+        }
+
+
+class QueryStats(Instrument):
+    """
+    SQLの形ごとの実行時間と、接続・コミットの時間を集計します
+    slowThresholdを超えたSQLは、バインドする値を伏せてログに出力します
+    """
+
+    def __init__(self, slowThreshold=None, logger=None):
+        """
+        @param slowThreshold この秒数以上かかったSQLをログに出力する。Noneなら出力しない
+        @param logger 出力先のlogging.Logger。省略すればこのモジュールのロガー
+        """
+        self.slowThreshold = slowThreshold
+        self.logger = logger if logger is not None else logging.getLogger(__name__)
+        self.connects = Timing()
+        self.commits = Timing()
+        self.statements = {}  # 正規化したSQL -> Timing
+        self._shapes = {}  # SQL -> 正規化したSQL
+        self._lock = threading.Lock()
+
+    def connected(self, mysql, seconds):
+        with self._lock:
+            self.connects.add(seconds)
+
+    def executed(self, mysql, sql, holder, seconds, rowcount):
+        shape = self._shapes.get(sql)
+        if shape is None:
+            shape = normalizeSql(sql)
+            if len(self._shapes) >= SHAPE_CACHE_SIZE:
+                self._shapes.clear()
+            self._shapes[sql] = shape
+        with self._lock:
+            timing = self.statements.get(shape)
+            if timing is None:
+                timing = self.statements[shape] = Timing()
+            timing.add(seconds, rowcount)
+        if self.slowThreshold is not None and seconds >= self.slowThreshold:
+            self.logger.warning('slow query %.1fms rows=%d: %s %s', seconds * 1000, rowcount, shape, redact(holder))
+
+    def committed(self, mysql, seconds):
+        with self._lock:
+            self.commits.add(seconds)
+
+    def report(self):
+        """
+        集計結果をディクショナリにして返します
+        """
+        with self._lock:
+            return {
+                'connect': self.connects.report(),
+                'commit': self.commits.report(),
+                'statements': dict((shape, timing.report()) for shape, timing in self.statements.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self.connects = Timing()
+            self.commits = Timing()
+            self.statements = {}
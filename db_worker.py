@@ -0,0 +1,142 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import sys
+import traceback
+from collections import deque
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from database3_4 import MySql
+
+"""
+データベースへの問い合わせをGUIスレッドの外で実行するためのクラス
+
+DbWorker.submit()にMySqlオブジェクトを受け取る関数を渡すと、スレッドプール上で接続してから実行し、
+結果をシグナル経由でGUIスレッドのコールバックに渡します
+"""
+
+WORKER_THREADS = 2  # 同時に実行するタスクの数
+
+
+class _TaskSignals(QObject):
+    """
+    ワーカースレッドからGUIスレッドへ結果を届けるためのシグナル
+    GUIスレッドで作成されるため、接続先のスロットはGUIスレッドで呼ばれます
+    """
+    finished = pyqtSignal(object, object)  # (タスク, 戻り値)
+    failed = pyqtSignal(object, object)  # (タスク, 例外)
+
+
+class DbTask(QRunnable):
+    """
+    ひとつのデータベース処理を表すタスクです
+    """
+
+    def __init__(self, dbArgs, func, signals, callback, errback, latest, serial):
+        QRunnable.__init__(self)
+        self.setAutoDelete(False)  # 完了まではDbWorkerが参照を持ち、取り消しにも使う
+        self.dbArgs = dbArgs
+        self.func = func
+        self.signals = signals
+        self.callback = callback
+        self.errback = errback
+        self.latest = latest
+        self.serial = serial
+
+    def run(self):
+        try:
+            with MySql(**self.dbArgs) as mysql:
+                result = self.func(mysql)
+        except Exception as e:
+            self.signals.failed.emit(self, e)
+        else:
+            self.signals.finished.emit(self, result)
+
+
+class DbWorker(QObject):
+    """
+    データベース処理をバックグラウンドで実行するクラスです
+    GUIスレッドから利用してください
+    """
+
+    def __init__(self, parent=None, **dbArgs):
+        """
+        @param dbArgs 各タスクで作成するMySqlオブジェクトに渡す引数
+        """
+        QObject.__init__(self, parent)
+        self.dbArgs = dbArgs
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(WORKER_THREADS)
+        self.signals = _TaskSignals(self)
+        self.signals.finished.connect(self._finished)
+        self.signals.failed.connect(self._failed)
+        self._running = set()  # 実行待ちか実行中のタスク
+        self._latest = {}  # latestに渡された値 -> 最後に投入されたタスク
+        self._serial = {}  # serialに渡された値 -> 順番待ちのタスクの列(先頭が実行中)
+
+    def submit(self, func, callback=None, errback=None, latest=None, serial=None):
+        """
+        タスクを投入します
+        @param func MySqlオブジェクトをひとつ引数に取る関数。ワーカースレッドで実行され、終了時にコミットされる
+        @param callback funcの戻り値をひとつ引数に取る関数。GUIスレッドで呼ばれる
+        @param errback funcで発生した例外をひとつ引数に取る関数。GUIスレッドで呼ばれ、省略すれば標準エラーに表示する
+        @param latest 同じ値で投入されたタスクのうち、最後のものの結果だけをcallbackに渡す
+                      古いタスクはまだ始まっていなければ取り消し、始まっていれば結果を捨てる
+        @param serial 同じ値で投入されたタスクは、投入順にひとつずつ実行する
+        @return 投入したタスク
+        """
+        task = DbTask(self.dbArgs, func, self.signals, callback, errback, latest, serial)
+        if latest is not None:
+            self.discard(latest)
+            self._latest[latest] = task
+        if serial is not None:
+            queue = self._serial.setdefault(serial, deque())
+            queue.append(task)
+            if len(queue) > 1:
+                return task  # 前のタスクが終わってから始める
+        self._start(task)
+        return task
+
+    def discard(self, latest):
+        """
+        指定された値で投入された最後のタスクを取り消し、まだ始まっていなければ実行もしません
+        順番待ちのタスクは取り消せないため、serialを指定したタスクは結果を捨てるだけです
+        """
+        task = self._latest.pop(latest, None)
+        if task is not None and task.serial is None and self.pool.tryTake(task):
+            self._running.discard(task)
+
+    def waitForDone(self, msecs=-1):
+        """
+        投入済みのタスクがすべて終わるまで待ちます
+        """
+        return self.pool.waitForDone(msecs)
+
+    def _start(self, task):
+        self._running.add(task)
+        self.pool.start(task)
+
+    def _done(self, task):
+        self._running.discard(task)
+        if task.serial is not None:
+            queue = self._serial[task.serial]
+            queue.popleft()
+            if queue:
+                self._start(queue[0])
+            else:
+                del self._serial[task.serial]
+        if task.latest is not None:
+            if self._latest.get(task.latest) is not task:
+                return False  # 後から投入されたタスクがあるので結果は古い
+            del self._latest[task.latest]
+        return True
+
+    def _finished(self, task, result):
+        if self._done(task) and task.callback is not None:
+            task.callback(result)
+
+    def _failed(self, task, error):
+        if not self._done(task):
+            return
+        if task.errback is not None:
+            task.errback(error)
+        else:
+            traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
@@ -0,0 +1,149 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import logging
+import sys
+import time
+from name_sync import TOMBSTONE_TABLE
+from record_cache import TABLE_NAME
+
+"""
+データベースのスキーマを順番に変更していくためのスクリプト
+
+適用済みのバージョンはschema_versionテーブルに記録し、MIGRATIONSのうち未適用のものだけを順に実行します
+PasswordUIWindowの起動時に自動で実行されるほか、コマンドラインからも実行できます
+
+python3 migration.py [--status] [--target バージョン] [--section セクション名] [--init-file 設定ファイル]
+"""
+
+VERSION_TABLE = 'schema_version'
+
+logger = logging.getLogger(__name__)
+
+
+def _createPasswordTable(mysql):
+    # 以前の_createTable()が作っていたテーブル。すでにあればそのまま使う
+    if not mysql.hasTable(TABLE_NAME):
+        mysql.createTable(
+            TABLE_NAME,
+            ('id', 'int', 'auto_increment', 'not null', 'primary key'),
+            ('name', 'varchar(255)', 'unique', 'not null'),
+            ('password', 'varchar(64)'),
+            ('memo', 'text'),
+            ('created', 'datetime'),
+            ('latest_update', 'datetime')
+        )
+
+
+def _addIndex(column):
+    name = '{}_{}'.format(TABLE_NAME, column)
+
+    def migrate(mysql):
+        if not mysql.hasIndex(TABLE_NAME, name):
+            mysql.createIndex(TABLE_NAME, name, (column, ))
+    return migrate
+
+
+def _widenPassword(mysql):
+    mysql.alterColumn(TABLE_NAME, 'password', 'varchar(255)')  # 暗号化した値が入るようにする
+
+
+def _addSearchIndex(mysql):
+    mysql.createSearchIndex(TABLE_NAME, ('name', 'memo'))
+
+
+def _createTombstoneTable(mysql):
+    if not mysql.hasTable(TOMBSTONE_TABLE):
+        mysql.createTable(
+            TOMBSTONE_TABLE,
+            ('name', 'varchar(255)', 'not null', 'primary key'),
+            ('deleted', 'datetime', 'not null')
+        )
+    name = TOMBSTONE_TABLE + '_deleted'
+    if not mysql.hasIndex(TOMBSTONE_TABLE, name):
+        mysql.createIndex(TOMBSTONE_TABLE, name, ('deleted', ))
+
+
+# (バージョン, 説明, 変更を行う関数)。関数は途中まで適用された状態から再実行されても失敗しないように書く
+MIGRATIONS = (
+    (1, 'create password_table', _createPasswordTable),
+    (2, 'index password_table.latest_update', _addIndex('latest_update')),
+    (3, 'index password_table.created', _addIndex('created')),
+    (4, 'widen password_table.password to varchar(255)', _widenPassword),
+    (5, 'full-text index on password_table.name and memo', _addSearchIndex),
+    (6, 'create password_tombstone', _createTombstoneTable),
+)
+
+
+def currentVersion(mysql):
+    """
+    適用済みの最新のバージョンを返します。まだ何も適用していなければ0を返します
+    """
+    if not mysql.hasTable(VERSION_TABLE):
+        return 0
+    result = mysql.query('select max(version) as version from ' + VERSION_TABLE)
+    result.next()
+    return result.get('version') or 0
+
+
+def pending(mysql, target=None):
+    """
+    未適用のマイグレーションを適用する順に並べたリストを返します
+    """
+    version = currentVersion(mysql)
+    return [migration for migration in MIGRATIONS
+            if migration[0] > version and (target is None or migration[0] <= target)]
+
+
+def migrate(mysql, target=None):
+    """
+    未適用のマイグレーションをtargetのバージョンまで順に適用します
+    各マイグレーションとそのバージョンの記録はひとつのトランザクションで行います
+    (MySQLではテーブル定義の変更は暗黙にコミットされるため、変更自体は取り消されません)
+    @param target 省略すれば最新のバージョンまで
+    @return 適用したバージョンのリスト
+    """
+    if not mysql.hasTable(VERSION_TABLE):
+        mysql.createTable(
+            VERSION_TABLE,
+            ('version', 'int', 'not null', 'primary key'),
+            ('description', 'varchar(255)'),
+            ('applied', 'datetime')
+        )
+        mysql.commit()
+    applied = []
+    for version, description, func in pending(mysql, target):
+        start = time.perf_counter()
+        with mysql.transaction():
+            func(mysql)
+            mysql.insert(VERSION_TABLE, ('version', 'description', 'applied'),
+                         (version, description, datetime.datetime.today().replace(microsecond=0)))
+        logger.info('migrated to %d (%s) in %.1fms', version, description, (time.perf_counter() - start) * 1000)
+        applied.append(version)
+    return applied
+
+
+def main(argv):
+    from database3_4 import MySql
+    import password_io
+    parser = argparse.ArgumentParser(description='password_tableのスキーマの更新')
+    parser.add_argument('--status', action='store_true', help='適用せずに現在のバージョンと未適用の一覧を表示する')
+    parser.add_argument('--target', type=int, help='このバージョンまで適用する。省略すれば最新まで')
+    parser.add_argument('--section', default=password_io.INIT_SECTION, help='設定ファイルのセクション')
+    parser.add_argument('--init-file', default=password_io.INIT_FILE, help='設定ファイルのパス')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    with MySql(init_section=args.section, init_file=args.init_file) as mysql:
+        if args.status:
+            print('current version:', currentVersion(mysql))
+            for version, description, _ in pending(mysql, args.target):
+                print('pending:', version, description)
+            return
+        if not migrate(mysql, args.target):
+            print('already up to date (version {})'.format(currentVersion(mysql)))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,191 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+
+"""
+名前の一覧を大文字小文字を区別しない順に並べて保持し、前方一致と部分一致で絞り込むためのクラス
+
+短い文字列は並べ替えた配列を二分探索して前方一致で、長い文字列は全名前を連結した文字列を検索して部分一致で絞り込みます
+"""
+
+SUBSTRING_MIN_LENGTH = 3  # この文字数以上で絞り込むときは部分一致にする
+
+
+def sortKey(name):
+    """
+    名前の並び順を決めるキー
+    """
+    return (name.lower(), name)
+
+
+def bisectNames(names, name):
+    """
+    sortKeyの順に並んだ名前のリストに対し、nameを挿入すべき位置を返します
+    """
+    key = sortKey(name)
+    lo, hi = 0, len(names)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if sortKey(names[mid]) < key:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def matches(name, text):
+    """
+    名前がfilter(text)の結果に含まれる条件を満たすかどうかを返します
+    """
+    text = text.lower()
+    if len(text) < SUBSTRING_MIN_LENGTH:
+        return name.lower().startswith(text)
+    return text in name.lower()
+
+
+class NameIndex(object):
+    """
+    重複のない名前の集合を、sortKeyの順に並べて保持するクラスです
+    """
+
+    def __init__(self, names=()):
+        self._keys = sorted(set(sortKey(name) for name in names))
+        self._blob = None  # 小文字にした全名前を改行でつないだ文字列
+        self._offsets = None  # _blob内での各名前の開始位置
+        self._last = None  # 直前の部分一致検索の(文字列, 結果)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __getitem__(self, position):
+        return self._keys[position][1]
+
+    def __iter__(self):
+        return (key[1] for key in self._keys)
+
+    def __contains__(self, name):
+        return self.position(name) >= 0
+
+    def names(self):
+        """
+        全名前を並び順のリストにして返します
+        """
+        return [key[1] for key in self._keys]
+
+    def position(self, name):
+        """
+        名前の位置を返します。含まれていなければ-1を返します
+        """
+        key = sortKey(name)
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return position
+        return -1
+
+    def add(self, name):
+        """
+        名前を追加します
+        @return 追加した位置。すでに含まれていれば-1
+        """
+        key = sortKey(name)
+        position = bisect_left(self._keys, key)
+        if position < len(self._keys) and self._keys[position] == key:
+            return -1
+        self._keys.insert(position, key)
+        self._changed()
+        return position
+
+    def remove(self, name):
+        """
+        名前を取り除きます
+        @return 取り除く前の位置。含まれていなければ-1
+        """
+        position = self.position(name)
+        if position >= 0:
+            del self._keys[position]
+            self._changed()
+        return position
+
+    def extend(self, names):
+        """
+        複数の名前をまとめて追加します。すでに含まれている名前は追加しません
+        すでに並んでいる部分はそのまま生かされるため、まとまりごとの追加でも全体を並べ直す費用はかかりません
+        """
+        keys = self._keys
+        added = [key for key in set(sortKey(name) for name in names) if not self._hasKey(key)]
+        if not added:
+            return
+        keys.extend(added)
+        keys.sort()
+        self._changed()
+
+    def filter(self, text):
+        """
+        条件に合う名前を並び順のリストにして返します
+        SUBSTRING_MIN_LENGTH文字未満なら前方一致、それ以上なら部分一致で、大文字小文字は区別しません
+        """
+        if len(text) < SUBSTRING_MIN_LENGTH:
+            return self.prefix(text)
+        return self.search(text)
+
+    def prefix(self, text):
+        """
+        textで始まる名前を並び順のリストにして返します
+        """
+        text = text.lower()
+        lo = bisect_left(self._keys, (text, ))
+        hi = bisect_left(self._keys, (text + '\U0010ffff', ))
+        return [key[1] for key in self._keys[lo:hi]]
+
+    def search(self, text):
+        """
+        textを含む名前を並び順のリストにして返します
+        直前の検索文字列を含む文字列で検索した場合は、直前の結果だけを調べます
+        """
+        text = text.lower()
+        last = self._last  # 他のスレッドが差し替えても、文字列と結果の組が食い違わないよう一度だけ読む
+        if last is not None and last[0] in text:
+            found = [name for name in last[1] if text in name.lower()]
+        else:
+            found = self._scan(text)
+        self._last = (text, found)
+        return found
+
+    def prepare(self):
+        """
+        部分一致の検索に使う文字列を作ります。作ってあれば何もしません
+        名前を追加・削除するたびに作り直しが必要になるため、絞り込みの前の空いた時間に呼んでおけば、
+        変更後の最初の絞り込みで作る時間がかかりません
+        """
+        if self._blob is not None:
+            return
+        folded = [key[0] for key in self._keys]
+        offsets = [0]
+        offsets.extend(accumulate(len(name) + 1 for name in folded))
+        # _blobが作られていれば_offsetsもそろっているよう、_blobを最後に設定する
+        self._offsets = offsets
+        self._blob = '\n'.join(folded)
+
+    def _hasKey(self, key):
+        position = bisect_left(self._keys, key)
+        return position < len(self._keys) and self._keys[position] == key
+
+    def _scan(self, text):
+        self.prepare()
+        found = []
+        blob = self._blob
+        offsets = self._offsets
+        start = blob.find(text)
+        while start >= 0:
+            position = bisect_right(offsets, start) - 1
+            found.append(self._keys[position][1])
+            if position + 1 >= len(offsets):
+                break
+            start = blob.find(text, offsets[position + 1])
+        return found
+
+    def _changed(self):
+        self._blob = None
+        self._offsets = None
+        self._last = None
@@ -0,0 +1,61 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import datetime
+from record_cache import TABLE_NAME
+
+"""
+他のクライアントによるpassword_tableの変更を、前回からの差分だけ問い合わせるための関数
+
+追加・更新はlatest_updateが前回の問い合わせ以降の行を、削除と名前の変更は元の名前を記録した
+password_tombstoneテーブルの行を読むため、問い合わせの費用はテーブルの行数ではなく変更の数に比例します
+latest_updateは各クライアントの時計で記録されるため、前回の問い合わせよりSYNC_OVERLAPだけ前から読み直します
+同じ変更を何度受け取っても結果が変わらないように反映してください
+"""
+
+TOMBSTONE_TABLE = 'password_tombstone'
+SYNC_OVERLAP = datetime.timedelta(seconds=60)  # クライアント間の時計のずれと、コミットの遅れによる取りこぼしを防ぐ幅
+TOMBSTONE_RETENTION = datetime.timedelta(days=30)  # これより古い削除の記録は消す
+
+
+def watermark():
+    """
+    現在日時を返します。全件を読み込む直前に呼び、最初のfetchChanges()に渡してください
+    """
+    return datetime.datetime.today().replace(microsecond=0)
+
+
+def recordDeletion(mysql, name, deleted=None):
+    """
+    名前がなくなったこと(削除か名前の変更)を記録し、TOMBSTONE_RETENTIONより古い記録を消します
+    削除や名前の変更と同じトランザクションで呼んでください
+    """
+    deleted = deleted or watermark()
+    mysql.upsertMany(TOMBSTONE_TABLE, ('name', 'deleted'), ((name, deleted), ), ('name', ))
+    mysql.update('delete from {} where deleted<%s'.format(TOMBSTONE_TABLE), (deleted - TOMBSTONE_RETENTION, ))
+
+
+def fetchChanges(mysql, since):
+    """
+    sinceの時点以降の変更を問い合わせます
+    @param since watermark()か、前回のfetchChanges()が返した日時
+    @return (次に渡す日時, 名前から最終更新日時へのディクショナリ, 削除された名前のリスト)
+            前回から間が空きすぎて削除の記録が消えているかもしれない場合は全件を返し、
+            削除された名前はNoneになる(ディクショナリにない名前はすべて削除されたものとして扱う)
+    """
+    checked = watermark()
+    if since < checked - TOMBSTONE_RETENTION + SYNC_OVERLAP:
+        result = mysql.query('select name, latest_update from ' + TABLE_NAME, stream=True)
+        return checked, dict(result.tuples()), None
+
+    start = since - SYNC_OVERLAP
+    result = mysql.query('select name, latest_update from {} where latest_update>=%s'.format(TABLE_NAME),
+                         (start, ), stream=True)
+    updated = dict(result.tuples())
+    # 削除した後に同じ名前で作り直されていれば残す。作り直しが削除と同じ秒でも判別できるよう、実際に調べる
+    result = mysql.query('select name from {} where deleted>=%s'.format(TOMBSTONE_TABLE), (start, ))
+    candidates = [name for name in result.values('name') if name not in updated]
+    existing = set()
+    if candidates:
+        sql = 'select name from {} where name in ({})'.format(TABLE_NAME, ','.join(['%s'] * len(candidates)))
+        existing.update(mysql.query(sql, candidates).values('name'))
+    return checked, updated, [name for name in candidates if name not in existing]
@@ -0,0 +1,122 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import json
+import os
+import socket
+import stat
+import sys
+import tempfile
+
+"""
+password_daemon.pyに問い合わせるコマンドラインのクライアント
+
+python3 password_cli.py get <名前>       パスワードを表示する
+python3 password_cli.py record <名前>    レコードをJSONで表示する
+python3 password_cli.py list [文字列]    名前の一覧を表示する。文字列を渡せば絞り込む(SelectComboの絞り込みと同じ)
+python3 password_cli.py search <文字列>  名前とメモを全文検索し、関連の高い順に名前を表示する
+python3 password_cli.py ping             デーモンが動いているか確かめる
+
+起動を速くするため、標準ライブラリ以外は読み込みません
+"""
+
+
+def socketPath():
+    """
+    デーモンが待ち受けるUnixソケットのパスを返します
+    XDG_RUNTIME_DIRがなければ、一時ディレクトリの下に所有者だけが使えるディレクトリを作って置きます
+    (誰でも書き込める一時ディレクトリに直接置くと、別のユーザーに先に同じ名前で作られてしまう)
+    """
+    directory = os.environ.get('XDG_RUNTIME_DIR')
+    if not directory:
+        directory = os.path.join(tempfile.gettempdir(), 'pypassword-{}'.format(os.getuid()))
+    return os.path.join(directory, 'pypassword.sock')
+
+
+def checkOwner(path):
+    """
+    ソケットとそのディレクトリが自分の所有で、ディレクトリに他のユーザーが書き込めないことを確かめます
+    別のユーザーが用意したソケットに接続すると、偽のパスワードを返されるおそれがあります
+    @raise PermissionError 条件を満たさない
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    for target in (directory, path):
+        info = os.lstat(target)
+        if info.st_uid != os.getuid():
+            raise PermissionError('{} is not owned by the current user'.format(target))
+    if stat.S_IMODE(os.lstat(directory).st_mode) & 0o022:
+        raise PermissionError('{} is writable by other users'.format(directory))
+
+
+class Client(object):
+    """
+    デーモンへの接続を保持し、要求を送って応答を受け取るクラスです
+    ひとつの接続で複数の要求を送れます
+    """
+
+    def __init__(self, path=None):
+        """
+        @raise PermissionError ソケットが自分のものでない(checkOwner()を参照)
+        """
+        path = path or socketPath()
+        checkOwner(path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self.reader = self.sock.makefile('rb')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+        return False
+
+    def request(self, op, **args):
+        """
+        要求を送り、結果を返します
+        @raise RuntimeError デーモンがエラーを返した
+        """
+        args['op'] = op
+        self.sock.sendall(json.dumps(args).encode('utf-8') + b'\n')
+        response = json.loads(self.reader.readline().decode('utf-8'))
+        if not response.get('ok'):
+            raise RuntimeError(response.get('error'))
+        return response.get('result')
+
+    def close(self):
+        self.reader.close()
+        self.sock.close()
+
+
+def main(argv):
+    if not argv or argv[0] not in ('get', 'record', 'list', 'search', 'ping'):
+        sys.exit('usage: password_cli.py get|record|list|search|ping [name or text]')
+    op = argv[0]
+    text = argv[1] if len(argv) > 1 else ''
+    try:
+        with Client() as client:
+            if op == 'get' or op == 'record':
+                record = client.request('get', name=text)
+                if record is None:
+                    sys.exit('not found: ' + text)
+                if op == 'get':
+                    print(record.get('password') or '')
+                else:
+                    print(json.dumps(record, ensure_ascii=False, indent=2))
+            elif op == 'list':
+                print('\n'.join(client.request('list', text=text)))
+            elif op == 'search':
+                print('\n'.join(client.request('search', text=text)))
+            else:
+                print(client.request('ping'))
+    except BrokenPipeError:
+        pass  # headなどに出力を途中で閉じられた
+    except (OSError, RuntimeError) as e:
+        sys.exit('password_cli: {}'.format(e))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,248 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import argparse
+import datetime
+import getpass
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+import time
+from database3_4 import ConfigCache, MySql, QueryCache
+from name_index import NameIndex
+from password_cli import Client, socketPath
+from record_cache import TABLE_NAME
+from vault import Vault, encryptionEnabled, vaultColumns
+
+"""
+GUIを使わずにパスワードを引くためのデーモン
+
+データベースへの接続と名前の索引を保持したまま、Unixソケットで一行ひとつのJSONの要求を受け付けます
+クライアントはpassword_cli.pyを使ってください
+
+python3 password_daemon.py [--section セクション名] [--init-file 設定ファイル] [--socket パス]
+
+要求 {"op": "get", "name": 名前}   -> レコード(なければnull)
+     {"op": "list", "text": 文字列} -> 名前のリスト
+     {"op": "search", "text": 文字列} -> 関連の高い順の名前のリスト
+     {"op": "ping"}                 -> "pong"
+応答 {"ok": true, "result": 結果} または {"ok": false, "error": メッセージ}
+"""
+
+NAME_REFRESH_INTERVAL = 30  # 名前の一覧を読み直す間隔(秒)。レコードのキャッシュもこの秒数で捨てる
+
+
+class PasswordDaemon(object):
+    """
+    接続と名前の索引を保持し、要求に答えるクラスです
+    接続はひとつだけを使い、複数のスレッドからの問い合わせはロックで順番に実行します
+    """
+
+    def __init__(self, dbArgs, vault=None, refreshInterval=NAME_REFRESH_INTERVAL):
+        """
+        @param dbArgs MySqlに渡す引数
+        @param vault unlock()済みのVault。暗号化した列を復号して返す
+        @param refreshInterval 名前の一覧を読み直す間隔(秒)
+        """
+        self.cache = QueryCache(ttl=refreshInterval)
+        self.mysql = MySql(pool=False, result_cache=self.cache, **dbArgs)
+        self.vault = vault if vault is not None else Vault()
+        self.refreshInterval = refreshInterval
+        self.names = NameIndex()
+        self._lock = threading.Lock()
+        self._handlers = {
+            'get': self.get,
+            'list': self.list,
+            'search': self.search,
+            'ping': lambda: 'pong',
+        }
+
+    def open(self):
+        """
+        接続して名前を読み込み、一定間隔で名前を読み直すスレッドを開始します
+        """
+        self.mysql.connect()
+        self.mysql.setAutocommit(True)  # 長く開いたトランザクションで古い内容を読み続けないようにする
+        self.reload()
+        thread = threading.Thread(target=self._refreshLoop, daemon=True)
+        thread.start()
+        return self
+
+    def close(self):
+        with self._lock:
+            self.mysql.close()
+
+    def reload(self):
+        """
+        名前の一覧を読み直します
+        """
+        names = self._run(lambda mysql: mysql.allValues(TABLE_NAME, 'name'))
+        index = NameIndex(names)
+        index.prepare()  # 要求を処理するスレッドが途中まで作られた索引を見ないよう、差し替える前に作り終える
+        self.names = index  # 参照の差し替えだけなので、読み込み中の要求は古い索引で答える
+
+    def handle(self, request):
+        """
+        要求のディクショナリを処理し、応答のディクショナリを返します
+        """
+        try:
+            handler = self._handlers[request.get('op')]
+        except KeyError:
+            return {'ok': False, 'error': 'unknown op: {}'.format(request.get('op'))}
+        args = dict((key, value) for key, value in request.items() if key != 'op')
+        try:
+            return {'ok': True, 'result': handler(**args)}
+        except Exception as e:
+            return {'ok': False, 'error': '{}: {}'.format(type(e).__name__, e)}
+
+    def get(self, name):
+        """
+        名前のレコードを、暗号化した列を復号して返します。なければNoneを返します
+        """
+        result = self._run(lambda mysql: mysql.query('select * from {} where name=%s'.format(TABLE_NAME), (name, )))
+        for row in result:
+            record = {}
+            for column, value in row.items():
+                value = self.vault.decrypt(column, value)
+                if isinstance(value, datetime.datetime):
+                    value = value.strftime('%Y-%m-%d %H:%M:%S')
+                record[column] = value
+            return record
+        return None
+
+    def list(self, text=''):
+        """
+        名前の一覧を返します。textを渡せばNameIndex.filter()で絞り込みます
+        索引はreload()で作り終えてから差し替え、以後は変更しないため、ロックを取らずに複数のスレッドから読めます
+        """
+        names = self.names
+        return names.filter(text) if text else names.names()
+
+    def search(self, text):
+        """
+        名前とメモを全文検索し、関連の高い順に名前を返します
+        """
+        return self._run(lambda mysql: mysql.search(TABLE_NAME, text)).values('name')
+
+    def _run(self, func):
+        with self._lock:
+            try:
+                return func(self.mysql)
+            except self.mysql.backend.Error:
+                # サーバーに切断された場合などは一度だけ接続し直して実行し直す
+                self.mysql._releaseConnector(broken=True)
+                self.mysql.connect()
+                self.mysql.setAutocommit(True)
+                return func(self.mysql)
+
+    def _refreshLoop(self):
+        while True:
+            time.sleep(self.refreshInterval)
+            try:
+                self.reload()
+            except Exception as e:
+                sys.stderr.write('password_daemon: reload failed: {}\n'.format(e))
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        daemon = self.server.passwordDaemon
+        for line in self.rfile:
+            try:
+                request = json.loads(line.decode('utf-8'))
+            except ValueError:
+                response = {'ok': False, 'error': 'invalid request'}
+            else:
+                response = daemon.handle(request)
+            self.wfile.write(json.dumps(response, ensure_ascii=False).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _prepareDirectory(directory):
+    """
+    ソケットを置くディレクトリを所有者だけが使えるように作ります
+    すでにあるディレクトリが自分のものでないか、他のユーザーが書き込める場合は使いません
+    """
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid():
+        raise RuntimeError('{} is not a directory owned by the current user'.format(directory))
+    if stat.S_IMODE(info.st_mode) & 0o022:
+        raise RuntimeError('{} is writable by other users'.format(directory))
+
+
+def _isAlive(path):
+    """
+    pathで待ち受けているデーモンが応答すればTrueを返します
+    接続を拒否されれば、前回のデーモンが異常終了して残したソケットなのでFalseを返します
+    """
+    try:
+        with Client(path) as client:
+            return client.request('ping') == 'pong'
+    except (ConnectionRefusedError, FileNotFoundError):
+        return False
+
+
+def serve(daemon, path=None):
+    """
+    Unixソケットで要求を待ち受けます。ソケットは所有者だけが使えるディレクトリに、所有者だけが読み書きできるように作ります
+    @raise RuntimeError 別のデーモンがすでに同じソケットで待ち受けている
+    """
+    path = path or socketPath()
+    _prepareDirectory(os.path.dirname(os.path.abspath(path)))
+    if os.path.lexists(path):
+        if _isAlive(path):
+            raise RuntimeError('another daemon is already listening on {}'.format(path))
+        os.remove(path)
+    umask = os.umask(0o177)
+    try:
+        server = _Server(path, _RequestHandler)
+    finally:
+        os.umask(umask)
+    server.passwordDaemon = daemon
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(path)
+
+
+def main(argv):
+    import password_io
+    parser = argparse.ArgumentParser(description='パスワードを引くためのデーモン')
+    parser.add_argument('--section', default=password_io.INIT_SECTION, help='設定ファイルのセクション')
+    parser.add_argument('--init-file', default=password_io.INIT_FILE, help='設定ファイルのパス')
+    parser.add_argument('--socket', help='待ち受けるUnixソケットのパス')
+    args = parser.parse_args(argv)
+
+    path = args.socket or socketPath()
+    if os.path.lexists(path) and _isAlive(path):  # パスフレーズを尋ねる前に確かめる
+        sys.exit('password_daemon: another daemon is already listening on {}'.format(path))
+    dbArgs = {'init_section': args.section, 'init_file': args.init_file}
+    config = ConfigCache.section(args.init_file, args.section)
+    vault = Vault(vaultColumns(config))
+    daemon = PasswordDaemon(dbArgs, vault).open()
+    if encryptionEnabled(config):
+        daemon._run(lambda mysql: vault.unlock(mysql, getpass.getpass('passphrase: ')))
+    try:
+        serve(daemon, path)
+    except KeyboardInterrupt:
+        pass
+    except RuntimeError as e:
+        sys.exit('password_daemon: {}'.format(e))
+    finally:
+        daemon.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,215 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import argparse
+import csv
+import datetime
+import json
+import os
+import sys
+import time
+from itertools import groupby, islice
+from operator import itemgetter
+from database3_4 import MySql
+from record_cache import TABLE_NAME
+
+"""
+password_tableの全レコードをCSVまたはJSON Linesのファイルに書き出し、読み込むためのスクリプト
+
+python3 password_io.py export <ファイル> [--format csv|jsonl] [--section セクション名] [--init-file 設定ファイル]
+python3 password_io.py import <ファイル> [--format csv|jsonl] [--section セクション名] [--init-file 設定ファイル]
+ファイルに-を指定すると標準入出力を使います。形式を省略した場合は拡張子(.csv / .jsonl)で判断します
+書き出しはサーバー側カーソルから一行ずつ、読み込みはIMPORT_BATCH_SIZE行ずつ処理するため、行数によらずメモリの使用量は一定です
+読み込みでは同じ名前のレコードがすでにあれば、ファイルの内容で更新します
+進捗と1秒あたりの行数は標準エラー出力に表示します
+"""
+
+INIT_SECTION = 'password'  # password_windowと同じ設定を使う
+INIT_FILE = os.path.join(os.environ.get('HOME', ''), 'python/PyPassword/config.ini')
+COLUMNS = ('name', 'password', 'memo', 'created', 'latest_update')  # 書き出す列。idは書き出さない
+DATETIME_COLUMNS = ('created', 'latest_update')
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+IMPORT_BATCH_SIZE = 500  # ひとつのinsert文にまとめる行数
+IMPORT_COMMIT_ROWS = 50000  # この行数ごとにコミットする
+PROGRESS_INTERVAL = 1.0  # 進捗を表示する間隔(秒)
+
+
+class Progress(object):
+    """
+    処理した行数と1秒あたりの行数を一定間隔で表示するクラス
+    """
+
+    def __init__(self, label, out=sys.stderr, interval=PROGRESS_INTERVAL):
+        self.label = label
+        self.out = out
+        self.interval = interval
+        self.count = 0
+        self.start = time.monotonic()
+        self._next = self.start + interval
+
+    def step(self, count=1):
+        self.count += count
+        now = time.monotonic()
+        if now >= self._next:
+            self._next = now + self.interval
+            self._show(now, '\r')
+
+    def finish(self):
+        self._show(time.monotonic(), '\r')
+        self.out.write('\n')
+        self.out.flush()
+
+    def rate(self, now=None):
+        elapsed = (now if now is not None else time.monotonic()) - self.start
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def _show(self, now, head):
+        self.out.write('{}{}: {} rows ({:.0f} rows/sec)'.format(head, self.label, self.count, self.rate(now)))
+        self.out.flush()
+
+
+def _toText(value):
+    if isinstance(value, datetime.datetime):
+        return value.strftime(DATETIME_FORMAT)
+    return value
+
+
+def _counted(rows, progress):
+    for row in rows:
+        yield row
+        progress.step()
+
+
+def exportRows(mysql, out, form, progress=None):
+    """
+    password_tableの全レコードをoutに書き出します
+    @param form 'csv'か'jsonl'
+    @return 書き出した行数
+    """
+    sql = 'select {} from {} order by id'.format(','.join(COLUMNS), TABLE_NAME)
+    rows = mysql.query(sql, stream=True).tuples()
+    if progress is not None:
+        rows = _counted(rows, progress)
+    count = 0
+    if form == 'csv':
+        writer = csv.writer(out)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow(['' if value is None else _toText(value) for value in row])
+            count += 1
+    else:
+        for row in rows:
+            out.write(json.dumps(dict(zip(COLUMNS, [_toText(value) for value in row])), ensure_ascii=False))
+            out.write('\n')
+            count += 1
+    return count
+
+
+def _csvRecords(source):
+    reader = csv.reader(source)
+    header = next(reader, None)
+    if header is None:
+        return
+    columns = tuple(header)
+    for values in reader:
+        if not values:
+            continue
+        if len(values) != len(columns):
+            raise ValueError('line {}: {} columns expected, got {}'.format(reader.line_num, len(columns), len(values)))
+        # CSVではNULLと空文字列を区別できないため、日時の列の空欄だけをNULLとして扱う
+        yield columns, tuple(None if value == '' and column in DATETIME_COLUMNS else value
+                             for column, value in zip(columns, values))
+
+
+def _jsonlRecords(source):
+    # 行ごとにキーが異なってもよいよう、その行が持つ列だけを(列名のタプル, 値のタプル)として返す
+    for number, line in enumerate(source, 1):
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        unknown = [column for column in record if column not in COLUMNS]
+        if unknown:
+            raise ValueError('line {}: unknown columns: {}'.format(number, ', '.join(unknown)))
+        columns = tuple(column for column in COLUMNS if column in record)
+        yield columns, tuple(record[column] for column in columns)
+
+
+def _upsertRows(mysql, columns, rows, now):
+    # 同じ列を持つ行をまとめて追加・更新する。更新するのはファイルにある列だけ
+    unknown = [column for column in columns if column not in COLUMNS]
+    if unknown:
+        raise ValueError('unknown columns: {}'.format(', '.join(unknown)))
+    if 'name' not in columns:
+        raise ValueError('name column is required')
+    updateColumns = tuple(column for column in columns if column != 'name')
+    added = tuple(column for column in DATETIME_COLUMNS if column not in columns)
+    if added:
+        columns += added
+        rows = (row + (now, ) * len(added) for row in rows)
+        if 'latest_update' in added:
+            updateColumns += ('latest_update', )
+    return mysql.upsertMany(TABLE_NAME, columns, rows, ('name', ), updateColumns, IMPORT_BATCH_SIZE)
+
+
+def importRows(mysql, source, form, progress=None):
+    """
+    sourceのレコードをpassword_tableに追加します。同じ名前のレコードがあれば、ファイルにある列だけを更新します
+    ファイルにcreatedやlatest_updateの列がなければ現在日時を使います(既存のレコードのcreatedは変えません)
+    JSON Linesでは行ごとにキーが異なってもよく、同じキーを持つ連続した行をまとめて処理します
+    IMPORT_COMMIT_ROWS行ごとにコミットし、途中で不正な行があればその行を含む分だけを取り消します
+    @param form 'csv'か'jsonl'
+    @return 読み込んだ行数
+    """
+    now = datetime.datetime.today().replace(microsecond=0)
+    records = _csvRecords(source) if form == 'csv' else _jsonlRecords(source)
+    if progress is not None:
+        records = _counted(records, progress)
+    count = 0
+    while True:
+        chunk = islice(records, IMPORT_COMMIT_ROWS)
+        done = 0
+        with mysql.transaction():
+            for columns, group in groupby(chunk, key=itemgetter(0)):
+                done += _upsertRows(mysql, columns, (values for _, values in group), now)
+        count += done
+        if done < IMPORT_COMMIT_ROWS:
+            return count
+
+
+def _format(path, form):
+    if form is not None:
+        return form
+    if path.endswith('.jsonl') or path.endswith('.json'):
+        return 'jsonl'
+    return 'csv'
+
+
+def _open(path, mode):
+    if path == '-':
+        stream = sys.stdin if mode == 'r' else sys.stdout
+        return open(stream.fileno(), mode, encoding='utf-8', newline='', closefd=False)
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description='password_tableの書き出しと読み込み')
+    parser.add_argument('command', choices=('export', 'import'))
+    parser.add_argument('file', help='書き出し先または読み込み元のファイル。-なら標準入出力')
+    parser.add_argument('--format', choices=('csv', 'jsonl'), help='省略すれば拡張子で判断する')
+    parser.add_argument('--section', default=INIT_SECTION, help='設定ファイルのセクション')
+    parser.add_argument('--init-file', default=INIT_FILE, help='設定ファイルのパス')
+    args = parser.parse_args(argv)
+
+    form = _format(args.file, args.format)
+    progress = Progress(args.command)
+    with MySql(init_section=args.section, init_file=args.init_file) as mysql:
+        if args.command == 'export':
+            with _open(args.file, 'w') as out:
+                exportRows(mysql, out, form, progress)
+        else:
+            with _open(args.file, 'r') as source:
+                importRows(mysql, source, form, progress)
+    progress.finish()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -3,66 +3,110 @@
 
 import sys
 import os
-from database3_4 import MySql
-
+import time
+_importStart = time.perf_counter()  # --profile-startupで表示するimportの時間の起点
+from database3_4 import ConfigCache, setDefaultInstrument
+from db_instrument import QueryStats
+from db_worker import DbWorker
+from record_cache import RecordCache
+from name_index import NameIndex, bisectNames, matches
+from vault import Vault, encryptionEnabled, vaultColumns
+from migration import migrate
+from name_sync import fetchChanges, recordDeletion, watermark
+
+from PyQt5.QtCore import QEvent, QObject, QTimer, Qt, QAbstractListModel, QModelIndex
 from PyQt5.QtWidgets import QApplication, QWidget, QPushButton, QHBoxLayout
-from PyQt5.QtWidgets import QLabel, QLineEdit, QComboBox
-from PyQt5.QtWidgets import QVBoxLayout, QTextEdit, QFormLayout
+from PyQt5.QtWidgets import QLabel, QLineEdit, QComboBox, QInputDialog, QListWidget
+from PyQt5.QtWidgets import QVBoxLayout, QTextEdit, QFormLayout, QMessageBox
 
 INIT_SECTION = 'password'
 INIT_FILE = os.path.join(os.environ.get('HOME'), 'python/PyPassword/config.ini')
-PASSWORD = 'digk473'
+SYNC_INTERVAL = 30  # 他のクライアントによる変更を取り込む間隔(秒)
+_importSeconds = time.perf_counter() - _importStart
 
 
 class Searchable:
     """
     ツリー構造になっている各要素のオブジェクトを取得するためのクラスです
+    各要素は自分とその子孫要素を型とタグごとに索引しており、型やタグによる検索はツリーをたどりません
     """
 
     def __init__(self):
         self.children = []
+        self.tag = None
         self._parent = None
+        self._root = self
+        self._types = {}  # 型 -> その型のインスタンスである子孫要素(自分を含む)のリスト
+        self._tags = {}  # タグ -> そのタグを持つ子孫要素(自分を含む)のリスト
+        self._index(self)
 
-    def add(self, child):
+    def add(self, child, tag=None):
+        """
+        子要素を追加し、その子孫要素を自分と祖先要素の索引に加えます
+        @param tag findByTag()で検索するための任意の値
+        """
         self.children.append(child)
         child._parent = self
+        if tag is not None:
+            child.tag = tag
+            child._tags.setdefault(tag, []).insert(0, child)
+        elems = child._types[Searchable]
+        root = self.root()
+        for elem in elems:
+            elem._root = root
+        node = self
+        while node is not None:
+            for elem in elems:
+                node._index(elem)
+            node = node._parent
+
+    def _index(self, elem):
+        for cls in type(elem).__mro__:
+            self._types.setdefault(cls, []).append(elem)
+        if elem.tag is not None:
+            self._tags.setdefault(elem.tag, []).append(elem)
+
+    def findByType(self, cls):
+        """
+        自分とその子孫要素のうち、指定された型のインスタンスである最初の要素を返します
+        見つからなければNoneを返します
+        """
+        elems = self._types.get(cls)
+        return elems[0] if elems else None
+
+    def findAllByType(self, cls):
+        """
+        自分とその子孫要素のうち、指定された型のインスタンスである要素をすべて入れたリストを返します
+        """
+        return list(self._types.get(cls, ()))
+
+    def findByTag(self, tag):
+        """
+        自分とその子孫要素のうち、指定されたタグを持つ最初の要素を返します
+        見つからなければNoneを返します
+        """
+        elems = self._tags.get(tag)
+        return elems[0] if elems else None
 
     def findAll(self, selector):
         """
         自分とその子孫要素に関数を適用し、Trueとなった要素がすべて入ったリストを作成します
         @param selector 要素をひとつ引数に取り、真偽値を返す関数
         """
-        ret = []
-        if selector(self):
-            ret.append(self)
-        for child in self.children:
-            ret.extend(child._findAll())
-        return ret
+        return [elem for elem in self._types[Searchable] if selector(elem)]
 
     def findElem(self, selector):
         """
         渡された関数に子孫要素を引数に渡し、最初にTrueとなった要素を返します
+        型で探す場合はfindByType()の方が速い
         """
-        for elem in self._findNext():
+        for elem in self._types[Searchable]:
             if selector(elem):
                 return elem
         return None
 
-    def _findNext(self):
-        """
-        自分とその子孫要素を次々と返していくジェネレータです
-        """
-        yield self
-        for child in self.children:
-            for ret in child._findNext():
-                yield ret
-        raise StopIteration
-
     def root(self):
-        elem = self
-        while elem._parent:
-            elem = elem._parent
-        return elem
+        return self._root
 
 
 class NameLabel(QLabel, Searchable):
@@ -187,8 +231,7 @@ class NewButton(QPushButton, Searchable):
         self.setStyleSheet(self.style)
 
     def _click(self):
-        selectCombo = self.root().findElem(
-            lambda e: isinstance(e, SelectCombo))
+        selectCombo = self.root().findByType(SelectCombo)
         selectCombo.setCurrentIndex(0)
 
 
@@ -199,6 +242,202 @@ class SelectComboLabel(QLabel, Searchable):
         Searchable.__init__(self)
 
 
+class NameListModel(QAbstractListModel):
+    """
+    SelectComboに表示する名前の一覧です
+    0行目は常に'new'で、1行目以降に名前を並び順に、絞り込み中は条件に合うものだけを並べます
+    名前の追加・削除・変更は該当する行だけを通知するため、一覧全体を作り直すことはありません
+    """
+
+    def __init__(self):
+        QAbstractListModel.__init__(self)
+        self.names = NameIndex()
+        self.filterText = ''
+        self._rows = []  # 表示している名前のリスト。0行目の'new'は含まない
+        # 名前が変わった後の部分一致の索引の作り直しは、入力を待っている間に済ませておく
+        self._prepareTimer = QTimer(self)
+        self._prepareTimer.setSingleShot(True)
+        self._prepareTimer.timeout.connect(self.names.prepare)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows) + 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.EditRole):
+            return None
+        return self.nameAt(index.row())
+
+    def nameAt(self, row):
+        return 'new' if row == 0 else self._rows[row - 1]
+
+    def rowOf(self, name):
+        """
+        名前を表示している行を返します。表示していなければ-1を返します
+        """
+        position = bisectNames(self._rows, name)
+        if position < len(self._rows) and self._rows[position] == name:
+            return position + 1
+        return -1
+
+    def extend(self, names):
+        """
+        名前をまとめて追加します
+        """
+        self.names.extend(names)
+        self._prepareTimer.start()
+        self._relayout()
+
+    def setFilter(self, text):
+        """
+        表示する名前を絞り込みます。空文字列なら全ての名前を表示します
+        """
+        self.filterText = text
+        self._relayout()
+
+    def addName(self, name):
+        """
+        名前を追加し、絞り込みの条件に合えば該当する行に挿入します
+        """
+        if self.names.add(name) < 0:
+            return
+        self._prepareTimer.start()
+        if not self._visible(name):
+            return
+        position = bisectNames(self._rows, name)
+        self.beginInsertRows(QModelIndex(), position + 1, position + 1)
+        self._rows.insert(position, name)
+        self.endInsertRows()
+
+    def removeName(self, name):
+        """
+        名前を取り除き、表示していれば該当する行を削除します
+        """
+        if self.names.remove(name) >= 0:
+            self._prepareTimer.start()
+        row = self.rowOf(name)
+        if row < 0:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self._rows[row - 1]
+        self.endRemoveRows()
+
+    def renameName(self, oldName, newName):
+        """
+        名前を変更します
+        表示している行は並び順の位置へ移動させるため、選択状態はその行についていきます
+        """
+        row = self.rowOf(oldName)
+        if row < 0:
+            self.names.remove(oldName)
+            self.addName(newName)
+            return
+        self.names.remove(oldName)
+        self.names.add(newName)
+        self._prepareTimer.start()
+        position = row - 1
+        destination = bisectNames(self._rows, newName)
+        if destination in (position, position + 1):
+            self._rows[position] = newName  # 並び順の位置が変わらないので、その場で書き換える
+            destination = position
+        else:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), destination + 1)
+            del self._rows[position]
+            if destination > position:
+                destination -= 1
+            self._rows.insert(destination, newName)
+            self.endMoveRows()
+        index = self.index(destination + 1)
+        self.dataChanged.emit(index, index)
+
+    def _visible(self, name):
+        return not self.filterText or matches(name, self.filterText)
+
+    def _relayout(self):
+        """
+        表示する名前を作り直します
+        選択中の行などは名前をたどって新しい行に付け替え、条件に合わなくなっても表示し続けます
+        """
+        self.layoutAboutToBeChanged.emit()
+        persistent = self.persistentIndexList()
+        kept = [self.nameAt(index.row()) for index in persistent]
+        # filter()の結果はNameIndexが次の絞り込みのために保持しているため、複製してから手を加える
+        self._rows = list(self.names.filter(self.filterText)) if self.filterText else self.names.names()
+        for index, name in zip(persistent, kept):
+            row = 0
+            if index.row() > 0:
+                row = self.rowOf(name)
+                if row < 0:
+                    position = bisectNames(self._rows, name)
+                    self._rows.insert(position, name)
+                    row = position + 1
+            self.changePersistentIndex(index, self.index(row))
+        self.layoutChanged.emit()
+
+
+class NameFilterInput(QLineEdit, Searchable):
+    """
+    SelectComboに表示する名前を入力した文字列で絞り込む欄
+    """
+
+    def __init__(self):
+        QLineEdit.__init__(self)
+        Searchable.__init__(self)
+        self.setPlaceholderText('filter')
+        self.setClearButtonEnabled(True)
+        self.textChanged.connect(self._changedText)
+
+    def _changedText(self, text):
+        self.root().findByType(SelectCombo).names.setFilter(text)
+
+
+class SearchInput(QLineEdit, Searchable):
+    """
+    名前とメモを全文検索する欄
+    入力するたびに検索し、関連の高い順にSearchResultListへ表示します
+    """
+
+    def __init__(self):
+        QLineEdit.__init__(self)
+        Searchable.__init__(self)
+        self.setPlaceholderText('search name and memo')
+        self.setClearButtonEnabled(True)
+        self.textChanged.connect(self._changedText)
+
+    def _changedText(self, text):
+        results = self.root().findByType(SearchResultList)
+        worker = self.root().worker
+        if not text.strip():
+            worker.discard('search')
+            results.clear()
+            return
+        # 入力が続いた場合は最後の入力の結果だけを表示する
+        worker.submit(
+            lambda mysql: mysql.search('password_table', text).values('name'),
+            results.showNames,
+            latest='search')
+
+
+class SearchResultList(QListWidget, Searchable):
+    """
+    SearchInputの検索結果。名前をクリックするとSelectComboでその名前を選択します
+    """
+
+    def __init__(self):
+        QListWidget.__init__(self)
+        Searchable.__init__(self)
+        self.setUniformItemSizes(True)
+        self.itemClicked.connect(self._clicked)
+
+    def showNames(self, names):
+        self.clear()
+        self.addItems(names)
+
+    def _clicked(self, item):
+        self.root().findByType(SelectCombo).selectName(item.text())
+
+
 class SelectCombo(QComboBox, Searchable):
     style = '''
     SelectCombo {
@@ -210,53 +449,101 @@ class SelectCombo(QComboBox, Searchable):
     def __init__(self):
         QComboBox.__init__(self)
         Searchable.__init__(self)
-        self._addNames()
+        self.names = NameListModel()
+        self.syncedAt = None  # 読み込んだ名前がいつ時点のものか
+        self.setModel(self.names)
+        self.view().setUniformItemSizes(True)  # 行の高さを個別に計算させない
         self.currentIndexChanged.connect(self._changedText)
         # self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
         self.setStyleSheet(self.style)
 
-    def _addNames(self):
-        with MySql(passwd=PASSWORD, init_file=INIT_FILE, init_section=INIT_SECTION) as mysql:
-            self.addItem('new')
-            names = mysql.allValues('password_table', 'name')
-            for name in names:
-                self.addItem(name)
+    def loadNames(self, callback=None, errback=None):
+        """
+        全ての名前をバックグラウンドで読み込み、読み込めたらcallbackを呼びます
+        以降の変更はsyncNames()で差分だけを取り込みます
+        @param errback 読み込めなかった場合に例外をひとつ引数に取る関数
+        """
+        def loaded(result):
+            self.syncedAt, names = result
+            self.names.extend(names)
+            if callback is not None:
+                callback()
+        self.root().worker.submit(
+            lambda mysql: (watermark(), mysql.allValues('password_table', 'name')),
+            loaded,
+            errback,
+            serial='password_table')  # マイグレーションでテーブルができてから読む
+
+    def syncNames(self):
+        """
+        前回の読み込み以降に他のクライアントが追加・変更・削除した名前をバックグラウンドで問い合わせ、
+        該当する行だけを一覧に反映します。キャッシュしているレコードのうち古くなったものは捨てます
+        """
+        since = self.syncedAt
+        if since is None:
+            return  # まだ全件を読み込んでいない
+        # 書き込みと順番に実行し、自分が消した名前を古い結果で戻さないようにする
+        self.root().worker.submit(
+            lambda mysql: fetchChanges(mysql, since),
+            self._synced,
+            latest='sync',
+            serial='password_table')
+
+    def _synced(self, changes):
+        self.syncedAt, updated, deleted = changes
+        if deleted is None:
+            deleted = [name for name in self.names.names if name not in updated]
+        for name in deleted:
+            self.names.removeName(name)
+        for name in updated:
+            self.names.addName(name)  # 表示済みの名前なら何もしない
+        self.root().records.applyChanges(updated, deleted)
+
+    def selectName(self, name):
+        """
+        名前を選択します。絞り込みで隠れている場合は絞り込みを解除します
+        """
+        row = self.names.rowOf(name)
+        if row < 0:
+            self.root().findByType(NameFilterInput).clear()
+            row = self.names.rowOf(name)
+        self.setCurrentIndex(row)
 
     def _changedText(self):
         selectedText = self.currentText()
         selectIndex = self.currentIndex()
-        nameInput = self.root().findElem(
-            lambda e: isinstance(e, NameInput))
-        passwordInput = self.root().findElem(
-            lambda e: isinstance(e, PasswordInput))
-        memoInput = self.root().findElem(
-            lambda e: isinstance(e, MemoInput))
+        worker = self.root().worker
         if selectIndex == 0:
-            nameInput.setText('')
-            passwordInput.setText('')
-            memoInput.setText('')
-        else:
-            with MySql(passwd=PASSWORD, init_file=INIT_FILE, init_section=INIT_SECTION) as mysql:
-                result = mysql.query(
-                    'select * from password_table where name=%s',
-                    (selectedText,))
-                try:
-                    nameInput.setText(result.get('name'))
-                    passwordInput.setText(result.get('password', ''))
-                    memoInput.setText(result.get('memo', ''))
-                except RuntimeError:
-                    """
-                    データの新規作成及び更新を行うとコンボボックス内の選択状態を変える必
-                    要が出てくるが、プログラム上での選択状態変更でもイベントは発生する。
-                    しかし、データベースの更新は非同期であるのか、更新直後で問い合わせを行って
-                    も新しい名前のレコードが存在せずRuntimeErrorが発生する。
-                    よって、更新削除後の UI変更はプログラム上ですべて行うこととし、エラーが発生
-                    してもエラー処理を行わず、このまま続行する
-
-                    削除の場合はエラーが出ないのはなぜ？
-                    = 削除後は他の(=削除行為以前から存在している)データを取り出すことになるため
-                    """
-                    pass
+            worker.discard('lookup')  # 直前の問い合わせの結果で入力欄を上書きさせない
+            self.root().findByType(NameInput).setText('')
+            self.root().findByType(PasswordInput).setText('')
+            self.root().findByType(MemoInput).setText('')
+            return
+        record = self.root().records.get(selectedText)
+        if record is not None:
+            # 起動時に読み込んだレコードや自分で書き込んだレコードは問い合わせずに表示する
+            worker.discard('lookup')
+            self._showRecord(record)
+            return
+        # 選択を素早く切り替えた場合は最後の選択の結果だけを表示する
+        worker.submit(
+            lambda mysql: mysql.query(
+                'select * from password_table where name=%s',
+                (selectedText,)),
+            self._loaded,
+            latest='lookup')
+
+    def _loaded(self, result):
+        for record in result:  # 他のクライアントに削除されていれば空
+            self.root().records.put(record)
+            self._showRecord(record)
+
+    def _showRecord(self, record):
+        # 暗号化された値は表示するこのレコードの分だけ復号する
+        vault = self.root().vault
+        self.root().findByType(NameInput).setText(record['name'])
+        self.root().findByType(PasswordInput).setText(vault.decrypt('password', record.get('password')) or '')
+        self.root().findByType(MemoInput).setText(vault.decrypt('memo', record.get('memo')) or '')
 
 
 class SelectComboLayout(QHBoxLayout, Searchable):
@@ -296,9 +583,18 @@ class LefterLayout(QVBoxLayout, Searchable):
         newButton = NewButton()
         self.add(newButton)
         self.addWidget(newButton)
+        nameFilter = NameFilterInput()
+        self.add(nameFilter)
+        self.addWidget(nameFilter)
         name = SelectComboLayout()
         self.add(name)
         self.addLayout(name)
+        search = SearchInput()
+        self.add(search)
+        self.addWidget(search)
+        results = SearchResultList()
+        self.add(results)
+        self.addWidget(results)
         dummy = DummyWidget()
         self.add(dummy)
         self.addWidget(dummy)
@@ -332,46 +628,59 @@ class RegistButton(QPushButton, Searchable):
 
     def _click(self):
         import datetime
-        selectCombo = self.root().findElem(
-            lambda e: isinstance(e, SelectCombo))
+        selectCombo = self.root().findByType(SelectCombo)
         selectedText = selectCombo.currentText()
-        nameInput = self.root().findElem(
-            lambda e: isinstance(e, NameInput))
-        passwordInput = self.root().findElem(
-            lambda e: isinstance(e, PasswordInput))
-        memoInput = self.root().findElem(
-            lambda e: isinstance(e, MemoInput))
+        nameInput = self.root().findByType(NameInput)
+        passwordInput = self.root().findByType(PasswordInput)
+        memoInput = self.root().findByType(MemoInput)
         newName = nameInput.text()
-        newPassword = passwordInput.text()
-        newMemo = memoInput.toPlainText()
-        newLatestUpdate = datetime.datetime.today()
+        vault = self.root().vault
+        newPassword, newMemo = vault.encryptValues(('password', 'memo'),
+                                                   (passwordInput.text(), memoInput.toPlainText()))
+        # データベースのdatetime型は秒までしか保存しないため、キャッシュの値もそろえる
+        newLatestUpdate = datetime.datetime.today().replace(microsecond=0)
         selectIndex = selectCombo.currentIndex()
         if len(newName) == 0:
             print('empty name -> return')
             return  # 名前欄が空欄なら何もしない
-        with MySql(passwd=PASSWORD, init_file=INIT_FILE, init_section=INIT_SECTION) as mysql:
-            if selectIndex == 0:
-                # 新規作成
-                mysql.insert(
+        worker = self.root().worker
+        records = self.root().records
+        record = {'name': newName, 'password': newPassword, 'memo': newMemo, 'latest_update': newLatestUpdate}
+        if selectIndex == 0:
+            # 新規作成
+            def inserted(rowId):
+                record.update(id=rowId, created=newLatestUpdate)
+                records.put(record)
+                # combobox上のデータ更新
+                selectCombo.names.addName(newName)
+                selectCombo.selectName(newName)
+            worker.submit(
+                lambda mysql: mysql.insert(
                     'password_table',
                     ('name', 'password', 'memo',
                      'created', 'latest_update'),
                     (newName, newPassword, newMemo,
                      newLatestUpdate, newLatestUpdate)
-                )
-                # combobox上のデータ更新
-                selectCombo.addItem(newName)
-                selectCombo.setCurrentIndex(selectCombo.count() - 1)
-            else:
-                # データ更新
+                ),
+                inserted,
+                serial='password_table')
+        else:
+            # データ更新
+            def update(mysql):
                 mysql.updateSet(
                     'password_table',
                     ('name', 'password', 'memo', 'latest_update'),
                     (newName, newPassword, newMemo, newLatestUpdate),
-                    'name="{}"'.format(selectedText)
+                    {'name': selectedText}
                 )
+                if newName != selectedText:
+                    recordDeletion(mysql, selectedText, newLatestUpdate)  # 他のクライアントから元の名前を消させる
+
+            def updated(_):
+                records.replace(selectedText, record)
                 # combobox上の名前を更新
-                selectCombo.setItemText(selectIndex, newName)
+                selectCombo.names.renameName(selectedText, newName)
+            worker.submit(update, updated, serial='password_table')
 
 
 class DeleteButton(QPushButton, Searchable):
@@ -382,15 +691,20 @@ class DeleteButton(QPushButton, Searchable):
         self.clicked.connect(self._click)
 
     def _click(self):
-        selectCombo = self.root().findElem(
-            lambda e: isinstance(e, SelectCombo))
+        selectCombo = self.root().findByType(SelectCombo)
         selectedText = selectCombo.currentText()
         selectIndex = selectCombo.currentIndex()
         if selectIndex == 0:
             return
-        with MySql(passwd=PASSWORD, init_file=INIT_FILE, init_section=INIT_SECTION) as mysql:
-            mysql.delete('password_table', 'name="{}"'.format(selectedText))
-            selectCombo.removeItem(selectIndex)
+
+        def delete(mysql):
+            mysql.delete('password_table', {'name': selectedText})
+            recordDeletion(mysql, selectedText)
+
+        def deleted(_):
+            self.root().records.remove(selectedText)
+            selectCombo.names.removeName(selectedText)
+        self.root().worker.submit(delete, deleted, serial='password_table')
 
 
 class ButtonLayout(QHBoxLayout, Searchable):
@@ -425,13 +739,139 @@ class MainLayout(QVBoxLayout, Searchable):
         self.addLayout(button)
 
 
-class PasswordUIWindow(QWidget, Searchable):
+class StartupProfile(QObject):
+    """
+    --profile-startupを指定して起動したときに、起動の各段階までの時間を計測して標準エラーに表示するクラス
+    接続と問い合わせの時間はdb_instrument.QueryStatsで集計します
+    """
 
     def __init__(self):
+        QObject.__init__(self)
+        self.marks = [('import', _importSeconds)]
+        self.stats = QueryStats()
+        setDefaultInstrument(self.stats)
+
+    def mark(self, name):
+        """
+        起動からの経過時間をnameの段階として記録します
+        """
+        self.marks.append((name, time.perf_counter() - _importStart))
+
+    def watch(self, window):
+        """
+        windowの最初の描画を記録します
+        """
+        window.installEventFilter(self)
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint:
+            obj.removeEventFilter(self)
+            self.mark('first paint')
+        return False
+
+    def report(self, out=sys.stderr):
+        stats = self.stats.report()
+        statements = stats['statements'].values()
+        for name, seconds in self.marks:
+            out.write('{:<16}{:9.1f}ms\n'.format(name, seconds * 1000))
+        out.write('{:<16}{:9.1f}ms ({} connections)\n'.format(
+            'connect', stats['connect']['total'] * 1000, stats['connect']['count']))
+        out.write('{:<16}{:9.1f}ms ({} statements)\n'.format(
+            'query', sum(timing['total'] for timing in statements) * 1000,
+            sum(timing['count'] for timing in statements)))
+        out.flush()
+
+
+class PasswordUIWindow(QWidget, Searchable):
+
+    def __init__(self, profile=None):
+        """
+        データベースには接続せずにウィジェットだけを作ります
+        マイグレーションと名前の読み込みはワーカースレッドで行うため、最初の描画はデータベースを待ちません
+        @param profile 起動の時間を記録するStartupProfile
+        """
         QWidget.__init__(self)
         Searchable.__init__(self)
-        self._createTable()
+        self.profile = profile
+        if profile is not None:
+            profile.watch(self)
+        # 書き込みは同じレコードへの変更の順序が入れ替わらないよう、すべて投入順に実行する
+        self.worker = DbWorker(self, init_file=INIT_FILE, init_section=INIT_SECTION)
+        self.records = RecordCache()  # 暗号化する列はデータベースと同じく暗号化したまま保持する
+        config = ConfigCache.section(INIT_FILE, INIT_SECTION)
+        self.encrypted = encryptionEnabled(config)
+        self.vault = Vault(vaultColumns(config))
+        self.syncTimer = QTimer(self)
+        self.syncTimer.setInterval(SYNC_INTERVAL * 1000)
+        self.syncTimer.timeout.connect(self.sync)
         self._initUI()
+        self._mark('window')
+        self._setEditable(False)  # 名前を読み込むまでは登録・削除させない
+        self._start()
+
+    def unlock(self, callback):
+        """
+        設定ファイルでencrypt = trueが指定されていれば、パスフレーズを尋ねて鍵を導出します
+        初めての場合は既存のレコードを暗号化します
+        鍵の導出とレコードの暗号化はワーカースレッドで行い、GUIスレッドではパスフレーズを尋ねるだけです
+        @param callback 暗号化を使わないか、鍵を導出できればTrue、パスフレーズの入力が取り消されればFalseを
+                        ひとつ引数に取る関数
+        """
+        if not self.encrypted or self.vault.isUnlocked():
+            callback(True)
+            return
+        self.worker.submit(
+            Vault.isSetUp,
+            lambda setUp: self._askPassphrase(setUp, 'passphrase:' if setUp else 'new passphrase:', callback),
+            self._startFailed,
+            serial='password_table')
+
+    def _askPassphrase(self, setUp, label, callback):
+        passphrase, ok = QInputDialog.getText(self, 'password keeper', label, QLineEdit.Password)
+        if not ok:
+            callback(False)
+            return
+        if not setUp:
+            again, ok = QInputDialog.getText(self, 'password keeper', 'new passphrase (again):',
+                                             QLineEdit.Password)
+            if not ok:
+                callback(False)
+                return
+            if passphrase != again:
+                self._askPassphrase(setUp, 'passphrases do not match. new passphrase:', callback)
+                return
+            self.worker.submit(
+                lambda mysql: self.vault.setup(mysql, passphrase),
+                lambda _: callback(True),
+                self._startFailed,
+                serial='password_table')
+            return
+
+        def failed(error):
+            if isinstance(error, ValueError):
+                self._askPassphrase(setUp, 'wrong passphrase. passphrase:', callback)
+            else:
+                self._startFailed(error)
+        self.worker.submit(
+            lambda mysql: self.vault.unlock(mysql, passphrase),
+            lambda _: callback(True),
+            failed,
+            serial='password_table')
+
+    def sync(self):
+        """
+        他のクライアントによる変更を名前の一覧とキャッシュしているレコードに反映します
+        """
+        self.findByType(SelectCombo).syncNames()
+
+    def changeEvent(self, event):
+        if event.type() == QEvent.ActivationChange and self.isActiveWindow():
+            self.sync()  # 他のウィンドウから戻ってきたときに確かめ直す
+        QWidget.changeEvent(self, event)
+
+    def closeEvent(self, event):
+        self.worker.waitForDone()  # 実行待ちの書き込みを終えてから閉じる
+        QWidget.closeEvent(self, event)
 
     def _initUI(self):
         self.setWindowTitle('password keeper')
@@ -439,25 +879,61 @@ class PasswordUIWindow(QWidget, Searchable):
         self.add(main)
         self.setLayout(main)
 
-    def _createTable(self):
-        with MySql(passwd=PASSWORD, init_file=INIT_FILE, init_section=INIT_SECTION) as mysql:
-            if not mysql.hasTable('password_table'):
-                mysql.createTable(
-                    'password_table',
-                    ('id', 'int', 'auto_increment', 'not null', 'primary key'),
-                    ('name', 'varchar(255)', 'unique', 'not null'),
-                    ('password', 'varchar(64)'),
-                    ('memo', 'text'),
-                    ('created', 'datetime'),
-                    ('latest_update', 'datetime')
-                )
+    def _mark(self, name):
+        if self.profile is not None:
+            self.profile.mark(name)
+
+    def _setEditable(self, editable):
+        self.findByType(RegistButton).setEnabled(editable)
+        self.findByType(DeleteButton).setEnabled(editable)
+
+    def _start(self):
+        self.worker.submit(migrate, self._migrated, self._startFailed, serial='password_table')
+
+    def _startFailed(self, error):
+        """
+        マイグレーション、鍵の導出、名前の読み込みに失敗したことを知らせ、やり直すかウィンドウを閉じるかを選ばせます
+        """
+        answer = QMessageBox.critical(
+            self, 'password keeper', 'cannot open the database:\n{}: {}'.format(type(error).__name__, error),
+            QMessageBox.Retry | QMessageBox.Close, QMessageBox.Retry)
+        if answer == QMessageBox.Retry:
+            self._start()  # 適用済みのマイグレーションは飛ばされる
+        else:
+            self.close()
+
+    def _migrated(self, applied):
+        self._mark('schema ready')
+        self.unlock(self._unlocked)
+
+    def _unlocked(self, ok):
+        if not ok:
+            self.close()
+            return
+        self.findByType(SelectCombo).loadNames(self._ready, self._startFailed)
+
+    def _ready(self):
+        self._mark('names loaded')
+        self._setEditable(True)
+        self.syncTimer.start()
+        # 名前を表示してから全レコードを読み込み、以降の選択では問い合わせない
+        self.worker.submit(RecordCache.fetchAll, self.records.load, serial='password_table')
+        if self.profile is not None:
+            self.profile.report()
+            QApplication.instance().quit()
 
 
 if __name__ == '__main__':
 
+    # --profile-startupを指定すると、名前を読み込み終えた時点で起動の各段階の時間を表示して終了する
+    profile = None
+    if '--profile-startup' in sys.argv:
+        sys.argv.remove('--profile-startup')
+        profile = StartupProfile()
+
     app = QApplication(sys.argv)
 
-    window = PasswordUIWindow()
+    window = PasswordUIWindow(profile)
 
     window.show()
 
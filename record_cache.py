@@ -0,0 +1,89 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+
+"""
+password_tableのレコードを名前から引くためのキャッシュ
+
+起動時に全レコードを一度だけ読み込み、以降は登録・更新・削除のたびにデータベースと同じ内容に書き換える(write-through)ため、
+レコードを表示するときにデータベースへ問い合わせる必要はありません
+他のクライアントに変更されて捨てたレコードだけは、次に表示するときに読み直します
+"""
+
+TABLE_NAME = 'password_table'
+
+
+class RecordCache(object):
+    """
+    名前からレコード(列名から値へのディクショナリ)を引くキャッシュです
+    GUIスレッドなど、ひとつのスレッドからのみ利用してください
+    """
+
+    def __init__(self):
+        self._records = {}
+
+    def __contains__(self, name):
+        return name in self._records
+
+    def __len__(self):
+        return len(self._records)
+
+    def get(self, name):
+        """
+        名前に対応するレコードを返します。キャッシュになければNoneを返します
+        """
+        return self._records.get(name)
+
+    def put(self, record):
+        """
+        レコードを追加するか、同じ名前のレコードを置き換えます
+        """
+        self._records[record['name']] = dict(record)
+
+    def replace(self, oldName, record):
+        """
+        oldNameのレコードを新しい内容に置き換えます。名前の変更にも使います
+        新しい内容にない列は元のレコードの値を引き継ぎます
+        """
+        old = self._records.pop(oldName, None)
+        merged = dict(old) if old is not None else {}
+        merged.update(record)
+        self._records[merged['name']] = merged
+
+    def remove(self, name):
+        self._records.pop(name, None)
+
+    def clear(self):
+        self._records.clear()
+
+    @staticmethod
+    def fetchAll(mysql):
+        """
+        load()に渡すための、テーブルの全レコードのリストを問い合わせます
+        ワーカースレッドから呼べるよう、キャッシュには触れません
+        """
+        return list(mysql.query('select * from ' + TABLE_NAME, stream=True))
+
+    def load(self, records):
+        """
+        fetchAll()で読み込んだレコードをまとめて追加します
+        すでにキャッシュにあるレコードは、読み込みより後に書き込まれた可能性があるため置き換えません
+        """
+        for record in records:
+            if record['name'] not in self._records:
+                self._records[record['name']] = record
+
+    def applyChanges(self, updated, deleted):
+        """
+        他のクライアントによる変更を反映します
+        最終更新日時がキャッシュと異なるレコードと、削除されたレコードを捨てます
+        捨てたレコードは次に参照されたときに読み直されます
+        @param updated 名前から最終更新日時へのディクショナリ(name_sync.fetchChanges()の戻り値)
+        @param deleted 削除された名前のリスト
+        @return 捨てたレコードの数
+        """
+        stale = [name for name, latestUpdate in updated.items()
+                 if name in self._records and self._records[name].get('latest_update') != latestUpdate]
+        stale.extend(name for name in deleted if name in self._records)
+        for name in stale:
+            del self._records[name]
+        return len(stale)
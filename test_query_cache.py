@@ -0,0 +1,49 @@
+#! /usr/bin/python3.4
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import unittest
+from database3_4 import MySql, QueryCache
+
+"""
+QueryCacheが書き込みのあったテーブルの結果を捨てることを、SQLiteのデータベースで確かめるテスト
+
+python3 -m unittest test_query_cache
+"""
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = QueryCache()
+        self.mysql = MySql(backend='sqlite', path=os.path.join(self.directory, 'test.sqlite3'),
+                           result_cache=self.cache).__enter__()
+        self.mysql.createTable('password_table',
+                               ('id', 'int', 'auto_increment', 'not null', 'primary key'),
+                               ('name', 'varchar(255)', 'unique', 'not null'),
+                               ('memo', 'text'))
+        self.mysql.createSearchIndex('password_table', ('name', 'memo'))
+        self.mysql.insert('password_table', ('name', 'memo'), ('mail', 'first'))
+
+    def tearDown(self):
+        self.mysql.close()
+        shutil.rmtree(self.directory)
+
+    def testTablesOf(self):
+        tablesOf = self.cache._tablesOf
+        self.assertEqual(sorted(tablesOf('select * from a join b on a.id = b.id')), ['a', 'b'])
+        self.assertEqual(sorted(tablesOf('select * from a x inner join b as y using (id) where 1')), ['a', 'b'])
+        self.assertEqual(sorted(tablesOf('select * from "a", `b` c left join d on 1')), ['a', 'b', 'd'])
+
+    def testWriteInvalidatesSearch(self):
+        self.assertEqual(self.mysql.search('password_table', 'mail').values('name'), ['mail'])
+        self.assertEqual(self.mysql.search('password_table', 'mail').values('name'), ['mail'])
+        self.assertEqual(self.cache.hits, 1)
+        self.mysql.insert('password_table', ('name', 'memo'), ('mail2', 'mail'))
+        self.assertEqual(sorted(self.mysql.search('password_table', 'mail').values('name')), ['mail', 'mail2'])
+
+
+if __name__ == '__main__':
+    unittest.main()
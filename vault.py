@@ -0,0 +1,262 @@
+#! /usr/bin/python3.6
+# -*- coding: utf-8 -*-
+import argparse
+import base64
+import getpass
+import hashlib
+import os
+import sys
+from record_cache import TABLE_NAME
+
+"""
+password_tableの列をパスフレーズから作った鍵で暗号化するためのクラス
+
+鍵はscryptでパスフレーズから一度だけ導出し、Vaultオブジェクトが保持している間はメモリ上で使い回します
+暗号化にはcryptographyパッケージのAES-GCMを使います(暗号化を有効にする場合のみ必要)
+暗号化した値は'enc1:'で始まる文字列として保存し、それ以外の値は暗号化前の値としてそのまま扱います
+鍵の導出に使うソルトと、パスフレーズの確認に使う値はvault_metaテーブルに保存します
+
+python3 vault.py setup [--section セクション名] [--init-file 設定ファイル]   既存のレコードを暗号化する
+python3 vault.py rotate [--section セクション名] [--init-file 設定ファイル]  パスフレーズを変えて暗号化し直す
+"""
+
+META_TABLE = 'vault_meta'
+ENCRYPTED_COLUMNS = ('password', )  # 暗号化する列。memoも暗号化する場合は設定ファイルでencrypt_memo = true
+PREFIX = 'enc1:'
+SCRYPT_N = 2 ** 15  # 約32MBのメモリを使う
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_SIZE = 16
+NONCE_SIZE = 12
+VERIFIER = b'PyPassword vault'
+ROTATE_BATCH_SIZE = 500  # 鍵を変えるときに一度に暗号化し直す行数
+
+
+def deriveKey(passphrase, salt, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    """
+    パスフレーズから32バイトの鍵を導出します。意図的に時間とメモリを消費します
+    """
+    return hashlib.scrypt(passphrase.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r, dklen=32)
+
+
+def isEncrypted(value):
+    return isinstance(value, str) and value.startswith(PREFIX)
+
+
+class Vault(object):
+    """
+    導出した鍵を保持し、列の値を暗号化・復号するクラスです
+    鍵を保持していない(unlockされていない)間は値をそのまま扱います
+    encrypt()とdecrypt()はスレッドセーフです
+    """
+
+    def __init__(self, columns=ENCRYPTED_COLUMNS):
+        """
+        @param columns 暗号化する列名のタプル
+        """
+        self.columns = tuple(columns)
+        self._cipher = None
+
+    def isUnlocked(self):
+        return self._cipher is not None
+
+    def lock(self):
+        """
+        保持している鍵を捨てます
+        """
+        self._cipher = None
+
+    @staticmethod
+    def isSetUp(mysql):
+        """
+        データベースに暗号化の設定があればTrueを返します
+        """
+        if not mysql.hasTable(META_TABLE):
+            return False
+        return mysql.query('select value from {} where name=%s'.format(META_TABLE), ('salt', )).count() > 0
+
+    def unlock(self, mysql, passphrase):
+        """
+        vault_metaのソルトでパスフレーズから鍵を導出して保持します
+        @raise ValueError パスフレーズが誤っている
+        """
+        meta = dict((row['name'], row['value']) for row in mysql.query('select name, value from ' + META_TABLE))
+        kdf = tuple(int(value) for value in meta['kdf'].split(':')[1:])
+        cipher = self._newCipher(deriveKey(passphrase, bytes.fromhex(meta['salt']), *kdf))
+        try:
+            verified = self._decrypt(cipher, 'verifier', meta['verifier']) == VERIFIER
+        except ValueError:
+            verified = False
+        if not verified:
+            raise ValueError('wrong passphrase')
+        self._cipher = cipher
+        return self
+
+    def setup(self, mysql, passphrase):
+        """
+        新しいソルトで鍵を作り、既存のレコードを暗号化します
+        vault_metaの作成とレコードの暗号化はひとつのトランザクションで行います
+        """
+        with mysql.transaction():
+            if not mysql.hasTable(META_TABLE):
+                mysql.createTable(
+                    META_TABLE,
+                    ('name', 'varchar(64)', 'not null', 'primary key'),
+                    ('value', 'text')
+                )
+            cipher = self._rekey(mysql, passphrase)
+        self._cipher = cipher  # コミットできた場合のみ新しい鍵に切り替える
+        return self
+
+    def rotate(self, mysql, passphrase, batchSize=ROTATE_BATCH_SIZE):
+        """
+        新しいパスフレーズとソルトで鍵を作り直し、全レコードを新しい鍵で暗号化し直します
+        すべてをひとつのトランザクションで行うため、途中で失敗しても古い鍵のままのデータが残ります
+        unlock()しておく必要があります
+        """
+        if not self.isUnlocked():
+            raise RuntimeError('vault is locked')
+        with mysql.transaction():
+            cipher = self._rekey(mysql, passphrase, batchSize)
+        self._cipher = cipher
+        return self
+
+    def _rekey(self, mysql, passphrase, batchSize=ROTATE_BATCH_SIZE):
+        """
+        全レコードを新しい鍵で暗号化し直してvault_metaを書き換え、新しい鍵の暗号器を返します
+        """
+        salt = os.urandom(SALT_SIZE)
+        kdf = (SCRYPT_N, SCRYPT_R, SCRYPT_P)
+        cipher = self._newCipher(deriveKey(passphrase, salt, *kdf))
+        columns = ('id', ) + self.columns
+        update = 'update {} set {} where id=%s'.format(TABLE_NAME, ','.join(column + '=%s' for column in self.columns))
+        lastId = 0
+        while True:
+            # 同じ接続で更新を行うとストリーミング中の結果は閉じられるため、idの順に区切って読む
+            rows = list(mysql.query(
+                'select {} from {} where id>%s order by id limit %s'.format(','.join(columns), TABLE_NAME),
+                (lastId, batchSize)).tuples())
+            if not rows:
+                break
+            lastId = rows[-1][0]
+            # 読んだ後に削除された行を作り直さないよう、追加ではなく更新にする
+            mysql.updateMany(
+                update,
+                [tuple(self._reencrypt(cipher, column, value) for column, value in zip(self.columns, row[1:]))
+                 + row[:1] for row in rows],
+                batchSize)
+        mysql.upsertMany(META_TABLE, ('name', 'value'), (
+            ('salt', salt.hex()),
+            ('kdf', 'scrypt:{}:{}:{}'.format(*kdf)),
+            ('verifier', self._encrypt(cipher, 'verifier', VERIFIER)),
+        ), ('name', ))
+        return cipher
+
+    def _reencrypt(self, cipher, column, value):
+        """
+        今の鍵で復号した値を新しい鍵で暗号化します。encrypt()と同じくNoneはそのまま返します
+        """
+        value = self.decrypt(column, value)
+        if value is None:
+            return None
+        return self._encrypt(cipher, column, value)
+
+    def encrypt(self, column, value):
+        """
+        暗号化する列の値を暗号化します。鍵がない場合、暗号化しない列の場合、Noneの場合はそのまま返します
+        """
+        cipher = self._cipher
+        if cipher is None or value is None or column not in self.columns:
+            return value
+        return self._encrypt(cipher, column, value)
+
+    def decrypt(self, column, value):
+        """
+        暗号化された値を復号します。暗号化されていない値はそのまま返します
+        @raise RuntimeError 暗号化された値を鍵なしで復号しようとした
+        """
+        if not isEncrypted(value):
+            return value
+        cipher = self._cipher
+        if cipher is None:
+            raise RuntimeError('vault is locked')
+        return self._decrypt(cipher, column, value).decode('utf-8')
+
+    def encryptValues(self, columns, values):
+        """
+        columnsに対応する値のタプルのうち、暗号化する列の値を暗号化したタプルを返します
+        """
+        return tuple(self.encrypt(column, value) for column, value in zip(columns, values))
+
+    @staticmethod
+    def _newCipher(key):
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM  # 暗号化を使わない環境では必要としない
+        return AESGCM(key)
+
+    @staticmethod
+    def _encrypt(cipher, column, value):
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        nonce = os.urandom(NONCE_SIZE)
+        # 列名を認証データに含め、別の列へ値を移し替えられないようにする
+        token = nonce + cipher.encrypt(nonce, value, column.encode('ascii'))
+        return PREFIX + base64.b64encode(token).decode('ascii')
+
+    @staticmethod
+    def _decrypt(cipher, column, value):
+        from cryptography.exceptions import InvalidTag
+        token = base64.b64decode(value[len(PREFIX):])
+        try:
+            return cipher.decrypt(token[:NONCE_SIZE], token[NONCE_SIZE:], column.encode('ascii'))
+        except InvalidTag:
+            raise ValueError('cannot decrypt {}'.format(column))
+
+
+def _flag(config, key):
+    return config.get(key, 'false').lower() in ('true', 'yes', 'on', '1')
+
+
+def encryptionEnabled(config):
+    """
+    設定ファイルのセクションでencrypt = trueが指定されていればTrueを返します
+    """
+    return _flag(config, 'encrypt')
+
+
+def vaultColumns(config):
+    """
+    設定ファイルのセクションから暗号化する列名のタプルを返します
+    """
+    if _flag(config, 'encrypt_memo'):
+        return ENCRYPTED_COLUMNS + ('memo', )
+    return ENCRYPTED_COLUMNS
+
+
+def main(argv):
+    from database3_4 import ConfigCache, MySql
+    import password_io
+    parser = argparse.ArgumentParser(description='password_tableの暗号化の設定')
+    parser.add_argument('command', choices=('setup', 'rotate'))
+    parser.add_argument('--section', default=password_io.INIT_SECTION, help='設定ファイルのセクション')
+    parser.add_argument('--init-file', default=password_io.INIT_FILE, help='設定ファイルのパス')
+    args = parser.parse_args(argv)
+
+    vault = Vault(vaultColumns(ConfigCache.section(args.init_file, args.section)))
+    with MySql(init_section=args.section, init_file=args.init_file) as mysql:
+        if args.command == 'setup':
+            if Vault.isSetUp(mysql):
+                sys.exit('already set up; use rotate to change the passphrase')
+        else:
+            vault.unlock(mysql, getpass.getpass('current passphrase: '))
+        passphrase = getpass.getpass('new passphrase: ')
+        if passphrase != getpass.getpass('new passphrase (again): '):
+            sys.exit('passphrases do not match')
+        if args.command == 'setup':
+            vault.setup(mysql, passphrase)
+        else:
+            vault.rotate(mysql, passphrase)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])